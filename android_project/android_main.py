@@ -7,6 +7,7 @@
 import os
 import sys
 import asyncio
+import threading
 
 # 添加当前目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -35,6 +36,7 @@ except ImportError:
 
 # 导入象棋逻辑
 from chinese_chess import ChineseChess
+from search import search, SearchLimits, TranspositionTable
 from network_client import GameNetworkClient
 
 class ChessBoardWidget(Widget):
@@ -54,6 +56,12 @@ class ChessBoardWidget(Widget):
         # 新增属性
         self.is_ai_game = False  # 是否AI对战
         self.ai_color = 'black'  # AI颜色
+        self.ai_depth = 4  # AI搜索的最大深度
+        self.ai_node_limit = 50000  # AI每步最多搜索的节点数
+        self.ai_time_limit = 1.5  # AI每步最多思考的秒数
+        self.ai_table_mb = 4  # AI置换表占用的内存上限 (MB)
+        self.ai_table = None  # 置换表, 第一次AI走棋时创建并在之后各步复用
+        self.ai_thinking = False  # 后台线程是否正在搜索 (同一时间只有一个搜索使用置换表)
         self.is_two_player = False  # 是否双人对战
         
         # 设置组件大小
@@ -216,8 +224,8 @@ class ChessBoardWidget(Widget):
                     # 检查是否是玩家的棋子，双人对战模式下可以操控双方
                     if self.is_two_player or (piece.color == 'red' and self.is_player_red) or (piece.color == 'black' and not self.is_player_red):
                         self.selected_piece = (row, col)
-                        # 获取有效移动，注意参数顺序是(row, col)
-                        self.valid_moves = self.chess_game.get_valid_moves(row, col)
+                        # 获取有效移动（排除送将），注意参数顺序是(row, col)
+                        self.valid_moves = self.chess_game.get_legal_moves(row, col)
                         self.draw_pieces()
                         self.highlight_selected()
                         self.highlight_valid_moves()
@@ -278,12 +286,15 @@ class ChessBoardWidget(Widget):
     
     def on_network_game_move(self, from_row, from_col, to_row, to_col):
         """收到对手移动"""
-        if self.chess_game.move_piece(from_row, from_col, to_row, to_col):
-            self.draw_pieces()
-            # 更新游戏状态
-            game_status = self.chess_game.get_game_status()
-            if game_status != 'playing':
-                self.show_game_result(game_status)
+        # move_piece 会校验这一步，不合法的走法（可能是不同步）不予执行
+        if not self.chess_game.move_piece(from_row, from_col, to_row, to_col):
+            print(f"收到非法移动: ({from_row}, {from_col}) -> ({to_row}, {to_col})")
+            return
+        self.draw_pieces()
+        # 更新游戏状态
+        game_status = self.chess_game.get_game_status()
+        if game_status != 'playing':
+            self.show_game_result(game_status)
     
     def on_network_game_state(self, current_player, game_status):
         """游戏状态更新"""
@@ -296,26 +307,46 @@ class ChessBoardWidget(Widget):
         self.draw_pieces()
     
     def ai_move(self):
-        """AI移动"""
-        import random
-        
-        # 获取所有有效的AI移动
-        all_valid_moves = []
-        board = self.chess_game.board
-        
-        # 遍历所有棋子，找到AI的棋子
-        for row in range(10):
-            for col in range(9):
-                piece = board[row][col]
-                if piece and piece.color == self.ai_color:
-                    # 获取该棋子的所有有效移动
-                    valid_moves = self.chess_game.get_valid_moves(row, col)
-                    for move in valid_moves:
-                        all_valid_moves.append((row, col, move[0], move[1]))
-        
-        if all_valid_moves:
-            # 随机选择一个有效的移动
-            from_row, from_col, to_row, to_col = random.choice(all_valid_moves)
+        """AI移动: 在后台线程中搜索, 搜索期间界面照常响应"""
+        if self.ai_thinking:
+            return
+        self.ai_thinking = True
+        
+        # 在深度、节点数和时间限制内搜索最佳走法
+        limits = SearchLimits(depth=self.ai_depth, nodes=self.ai_node_limit, time=self.ai_time_limit)
+        if self.ai_table is None:
+            self.ai_table = TranspositionTable(self.ai_table_mb)
+        
+        # 后台线程只接触对局副本, 记下搜索时的局面以便结果回来时核对
+        game = self.chess_game
+        position = (game, game.zobrist_key, game.history_len)
+        worker = threading.Thread(target=self.search_ai_move, args=(game.clone(), limits, position))
+        worker.daemon = True
+        worker.start()
+    
+    def search_ai_move(self, game, limits, position):
+        """后台线程: 搜索完成后交回界面线程执行走法"""
+        result = None
+        try:
+            result = search(game, limits, self.ai_table)
+        finally:
+            Clock.schedule_once(lambda dt: self.apply_ai_move(result, position))
+    
+    def apply_ai_move(self, result, position):
+        """界面线程: 执行后台搜索得到的走法"""
+        self.ai_thinking = False
+        
+        # 搜索期间悔棋、重新开始或换了对局, 这个结果已经作废
+        game, key, ply = position
+        if game is not self.chess_game or game.zobrist_key != key or game.history_len != ply:
+            if self.is_ai_game and self.chess_game.get_current_player() == self.ai_color \
+                    and self.chess_game.get_game_status() == 'playing':
+                self.ai_move()
+            return
+        
+        if result and result.best_move:
+            from_row, from_col = divmod(result.best_move >> 8, 9)
+            to_row, to_col = divmod(result.best_move & 255, 9)
             
             # 执行移动
             if self.chess_game.move_piece(from_row, from_col, to_row, to_col):
@@ -334,6 +365,8 @@ class ChessBoardWidget(Widget):
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         if result == 'red_wins':
             content.add_widget(Label(text='红方获胜！', font_size=24, bold=True))
+        elif result == 'draw':
+            content.add_widget(Label(text='和棋！', font_size=24, bold=True))
         else:
             content.add_widget(Label(text='黑方获胜！', font_size=24, bold=True))
         
@@ -745,6 +778,8 @@ class GameScreen(Screen):
             
             if game_status == 'playing':
                 self.status_label.text = f'{"红方" if current_player == "red" else "黑方"}回合'
+            elif game_status == 'draw':
+                self.status_label.text = '和棋'
             else:
                 self.status_label.text = f'{"红方获胜" if game_status == "red_wins" else "黑方获胜"}'
 
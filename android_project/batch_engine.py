@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+批量走法生成: 用 NumPy 同时处理大量局面
+
+局面以 (N, 90) 的 int8 数组表示, 每个元素是 chinese_chess 中的棋子编码
+(兵种 | 颜色, 0 为空), 下标为 row * 9 + col。轮走方以 (N,) 数组表示, 取值 RED/BLACK。
+走法掩码为 (N, 90, 90) 的 bool 数组, mask[n, from_sq, to_sq] 表示第 n 个局面可走该步,
+其中伪合法掩码逐格与 ChineseChess.get_valid_moves 完全一致。
+
+用于生成数据集、批量校验对局, 应用本身不依赖 NumPy。局面很多时请分块调用,
+每个局面的走法掩码占 8100 字节。
+"""
+
+import numpy as np
+
+from chinese_chess import (
+    ChineseChess, BOARD_SIZE, GENERAL, ADVISOR, ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER,
+    COLOR_MASK, RED, BLACK, GENERAL_STEPS, ADVISOR_STEPS, ELEPHANT_STEPS,
+    HORSE_STEPS, SOLDIER_STEPS, HORSE_ATTACKS, SOLDIER_ATTACKS,
+)
+
+# 棋盘外的哨兵格: 局面数组右侧补一列空格, 表中的空位都指向它
+OFF_BOARD = BOARD_SIZE
+
+# 对局结果编码, 与 ChineseChess.game_status 的字符串对应 (不含循环局面判和)
+PLAYING, RED_WINS, BLACK_WINS = 0, 1, 2
+STATUS_NAMES = ('playing', 'red_wins', 'black_wins')
+
+
+def _padded(table):
+    """把按格子索引的变长走法表补齐为 (目标格, 阻挡格, 有效) 三个 (90, K) 数组"""
+    width = max(len(entries) for entries in table)
+    targets = np.full((BOARD_SIZE, width), OFF_BOARD, dtype=np.intp)
+    blocks = np.full((BOARD_SIZE, width), OFF_BOARD, dtype=np.intp)
+    for sq, entries in enumerate(table):
+        for index, entry in enumerate(entries):
+            if isinstance(entry, tuple):
+                targets[sq, index], blocks[sq, index] = entry
+            else:
+                targets[sq, index] = entry
+    return targets, blocks, targets != OFF_BOARD
+
+
+# LEAPERS[side >> 3][兵种] = 补齐后的跳子走法表 (马腿/象眼为阻挡格)
+LEAPERS = tuple(
+    {GENERAL: _padded(GENERAL_STEPS[index]), ADVISOR: _padded(ADVISOR_STEPS[index]),
+     ELEPHANT: _padded(ELEPHANT_STEPS[index]), HORSE: _padded(HORSE_STEPS),
+     SOLDIER: _padded(SOLDIER_STEPS[index])}
+    for index in range(2)
+)
+
+
+def _build_rays():
+    """RAYS[sq, 方向, 步] 为从 sq 出发的射线格, 方向依次为上、下、左、右"""
+    rays = np.full((BOARD_SIZE, 4, 9), OFF_BOARD, dtype=np.intp)
+    for sq in range(BOARD_SIZE):
+        row, col = divmod(sq, 9)
+        for direction, (dr, dc) in enumerate(((-1, 0), (1, 0), (0, -1), (0, 1))):
+            r, c, step = row + dr, col + dc, 0
+            while 0 <= r < 10 and 0 <= c < 9:
+                rays[sq, direction, step] = r * 9 + c
+                r, c, step = r + dr, c + dc, step + 1
+    return rays
+
+RAYS = _build_rays()
+RAY_VALID = RAYS != OFF_BOARD
+
+# 反向攻击表: 能攻击 sq 的马 (位置, 马腿) 和兵卒位置
+HORSE_ORIGINS, HORSE_LEGS, _ = _padded(HORSE_ATTACKS)
+SOLDIER_ORIGINS = tuple(_padded(SOLDIER_ATTACKS[index])[0] for index in range(2))
+
+
+def boards_from_games(games):
+    """把若干 ChineseChess 对局转成 (局面数组, 轮走方数组)"""
+    boards = np.array([np.frombuffer(bytes(game.squares), dtype=np.int8) for game in games],
+                      dtype=np.int8).reshape(-1, BOARD_SIZE)
+    sides = np.array([RED if game.current_player == 'red' else BLACK for game in games],
+                     dtype=np.int8)
+    return boards, sides
+
+
+def boards_from_fens(fens):
+    """把若干 FEN 转成 (局面数组, 轮走方数组)"""
+    return boards_from_games([ChineseChess.from_fen(fen) for fen in fens])
+
+
+def _extend(boards):
+    """在局面右侧补一列空的哨兵格"""
+    boards = np.asarray(boards, dtype=np.int8)
+    return np.concatenate([boards, np.zeros((len(boards), 1), dtype=np.int8)], axis=1)
+
+
+def _piece_relations(boards, attacks):
+    """所有棋子的 (局面, 起点, 目标) 三元组
+
+    attacks 为 False 时是伪合法走法; 为 True 时是攻击关系, 即目标格上若有对方棋子就能吃到,
+    与 ChineseChess._is_attacked 的含义相同 (不含将帅照面)。
+    """
+    ext = _extend(boards)
+    found_n, found_from, found_to = [], [], []
+
+    def add(n, origin, targets, ok):
+        hit_n, hit_k = np.nonzero(ok)
+        found_n.append(n[hit_n])
+        found_from.append(origin[hit_n])
+        found_to.append(targets[hit_n, hit_k])
+
+    for side in (RED, BLACK):
+        for piece_type in (GENERAL, ADVISOR, ELEPHANT, HORSE, SOLDIER):
+            n, origin = np.nonzero(ext[:, :BOARD_SIZE] == side | piece_type)
+            if not len(n):
+                continue
+            table_targets, table_blocks, table_valid = LEAPERS[side >> 3][piece_type]
+            targets = table_targets[origin]
+            ok = table_valid[origin] & (ext[n[:, None], table_blocks[origin]] == 0)
+            if not attacks:
+                dest = ext[n[:, None], targets]
+                ok &= (dest == 0) | ((dest & COLOR_MASK) != side)
+            add(n, origin, targets, ok)
+
+        for piece_type in (CHARIOT, CANNON):
+            n, origin = np.nonzero(ext[:, :BOARD_SIZE] == side | piece_type)
+            if not len(n):
+                continue
+            targets = RAYS[origin].reshape(len(origin), 36)
+            codes = ext[n[:, None], targets].reshape(-1, 4, 9)
+            occupied = codes != 0
+            # 沿射线在该格之前已经越过的棋子数
+            passed = np.cumsum(occupied, axis=2) - occupied
+            if attacks:
+                ok = passed == (0 if piece_type == CHARIOT else 1)
+            else:
+                enemy = occupied & ((codes & COLOR_MASK) != side)
+                if piece_type == CHARIOT:
+                    ok = (passed == 0) & (~occupied | enemy)
+                else:
+                    ok = ((passed == 0) & ~occupied) | ((passed == 1) & enemy)
+            ok &= RAY_VALID[origin]
+            add(n, origin, targets, ok.reshape(len(origin), 36))
+
+    if not found_n:
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty, empty
+    return np.concatenate(found_n), np.concatenate(found_from), np.concatenate(found_to)
+
+
+def pseudo_move_mask(boards):
+    """盘上每个棋子的伪合法走法掩码 (N, 90, 90), mask[n, sq] 与 get_valid_moves 一致"""
+    n, origin, target = _piece_relations(boards, attacks=False)
+    mask = np.zeros((len(boards), BOARD_SIZE, BOARD_SIZE), dtype=bool)
+    mask[n, origin, target] = True
+    return mask
+
+
+def attack_maps(boards):
+    """攻击图 (N, 2, 90): [n, side >> 3, sq] 为 side 方是否攻击 sq, 含义同 _is_attacked"""
+    n, origin, target = _piece_relations(boards, attacks=True)
+    sides = (np.asarray(boards, dtype=np.int8)[n, origin] & COLOR_MASK) >> 3
+    maps = np.zeros((len(boards), 2, BOARD_SIZE), dtype=bool)
+    maps[n, sides, target] = True
+    return maps
+
+
+def _general_attacked(boards, sides):
+    """各局面中 sides 方的将帅是否被将军 (含将帅照面), 没有将帅时为 False"""
+    ext = _extend(boards)
+    sides = np.asarray(sides, dtype=np.int8)
+    count = len(ext)
+    rows = np.arange(count)[:, None]
+    generals = ext[:, :BOARD_SIZE] == (sides | GENERAL)[:, None]
+    present = generals.any(axis=1)
+    general_sq = generals.argmax(axis=1)
+    enemy = (sides ^ COLOR_MASK)[:, None, None]
+
+    # 直线: 第一个棋子为对方车 (或纵线上的对方将帅), 第二个棋子为对方炮
+    codes = ext[rows, RAYS[general_sq].reshape(count, 36)].reshape(count, 4, 9)
+    occupied = codes != 0
+    passed = np.cumsum(occupied, axis=2) - occupied
+    first = occupied & (passed == 0)
+    flying = np.zeros((1, 4, 1), dtype=bool)
+    flying[0, :2] = True
+    attacked = (first & ((codes == (enemy | CHARIOT)) | (flying & (codes == (enemy | GENERAL))))).any(axis=(1, 2))
+    attacked |= (occupied & (passed == 1) & (codes == (enemy | CANNON))).any(axis=(1, 2))
+
+    enemy = enemy[:, :, 0]
+    horses = (ext[rows, HORSE_ORIGINS[general_sq]] == (enemy | HORSE)) & (ext[rows, HORSE_LEGS[general_sq]] == 0)
+    attacked |= horses.any(axis=1)
+    for index, side in enumerate((RED, BLACK)):
+        # 攻击方为 side 的兵卒
+        soldiers = ext[rows, SOLDIER_ORIGINS[index][general_sq]] == (side | SOLDIER)
+        attacked |= soldiers.any(axis=1) & (enemy[:, 0] == side)
+    return present & attacked
+
+
+def in_check(boards, sides):
+    """各局面的轮走方是否被将军"""
+    return _general_attacked(boards, sides)
+
+
+def _legal_moves(boards, sides):
+    """轮走方全部合法走法的 (局面, 起点, 目标) 三元组"""
+    boards = np.asarray(boards, dtype=np.int8)
+    sides = np.asarray(sides, dtype=np.int8)
+    n, origin, target = _piece_relations(boards, attacks=False)
+    own = (boards[n, origin] & COLOR_MASK) == sides[n]
+    n, origin, target = n[own], origin[own], target[own]
+
+    # 每步走法各走出一个新局面, 再批量检查己方将帅是否受攻击
+    after = boards[n]
+    index = np.arange(len(n))
+    after[index, target] = after[index, origin]
+    after[index, origin] = 0
+    keep = ~_general_attacked(after, sides[n])
+    return n[keep], origin[keep], target[keep]
+
+
+def legal_move_mask(boards, sides):
+    """轮走方的合法走法掩码 (N, 90, 90), 与 ChineseChess.legal_moves 一致"""
+    n, origin, target = _legal_moves(boards, sides)
+    mask = np.zeros((len(boards), BOARD_SIZE, BOARD_SIZE), dtype=bool)
+    mask[n, origin, target] = True
+    return mask
+
+
+def legal_move_counts(boards, sides):
+    """各局面轮走方的合法走法数"""
+    n, _, _ = _legal_moves(boards, sides)
+    return np.bincount(n, minlength=len(boards))
+
+
+def game_end_flags(boards, sides):
+    """各局面的对局结果编码 (PLAYING/RED_WINS/BLACK_WINS), 判定顺序同 check_game_status"""
+    boards = np.asarray(boards, dtype=np.int8)
+    sides = np.asarray(sides, dtype=np.int8)
+    status = np.where(sides == RED, BLACK_WINS, RED_WINS).astype(np.int8)
+    status[legal_move_counts(boards, sides) > 0] = PLAYING
+    status[~(boards == (BLACK | GENERAL)).any(axis=1)] = RED_WINS
+    status[~(boards == (RED | GENERAL)).any(axis=1)] = BLACK_WINS
+    return status
@@ -1,3 +1,8 @@
+import random
+import struct
+import sys
+import threading
+from array import array
 from enum import Enum
 
 class PieceType(Enum):
@@ -10,373 +15,2009 @@ class PieceType(Enum):
     SOLDIER = "兵卒"
 
 class Piece:
-    def __init__(self, piece_type, color, row, col):
-        self.type = piece_type
-        self.color = color
-        self.row = row
-        self.col = col
-        self.is_selected = False
-    
+    """不可变的棋子享元: 每种颜色、兵种只有一个实例 (见 PIECES), 位置由棋盘记录"""
+    __slots__ = ('type', 'color', 'code', 'glyph', 'value')
+
+    RED_GLYPHS = {
+        PieceType.GENERAL: '帅',
+        PieceType.ADVISOR: '仕',
+        PieceType.ELEPHANT: '相',
+        PieceType.HORSE: '马',
+        PieceType.CHARIOT: '车',
+        PieceType.CANNON: '炮',
+        PieceType.SOLDIER: '兵'
+    }
+
+    BLACK_GLYPHS = {
+        PieceType.GENERAL: '将',
+        PieceType.ADVISOR: '士',
+        PieceType.ELEPHANT: '象',
+        PieceType.HORSE: '馬',
+        PieceType.CHARIOT: '車',
+        PieceType.CANNON: '砲',
+        PieceType.SOLDIER: '卒'
+    }
+
+    def __init__(self, piece_type, color):
+        code = TYPE_CODES[piece_type] | COLOR_BITS[color]
+        glyph = (self.RED_GLYPHS if color == 'red' else self.BLACK_GLYPHS)[piece_type]
+        for name, value in (('type', piece_type), ('color', color), ('code', code),
+                            ('glyph', glyph), ('value', PIECE_VALUES[code & TYPE_MASK])):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Piece 是共享的享元, 不可修改')
+
+    def __reduce__(self):
+        # pickle 和 copy 都还原为同一个共享对象
+        return (piece_from_code, (self.code,))
+
+    def __repr__(self):
+        return 'Piece(%s, %r)' % (self.type.name, self.color)
+
     def get_display_char(self):
         """获取棋子的显示字符"""
-        piece_chars = {
-            PieceType.GENERAL: '帅',
-            PieceType.ADVISOR: '仕',
-            PieceType.ELEPHANT: '相',
-            PieceType.HORSE: '马',
-            PieceType.CHARIOT: '车',
-            PieceType.CANNON: '炮',
-            PieceType.SOLDIER: '兵'
-        }
-        
-        black_piece_chars = {
-            PieceType.GENERAL: '将',
-            PieceType.ADVISOR: '士',
-            PieceType.ELEPHANT: '象',
-            PieceType.HORSE: '馬',
-            PieceType.CHARIOT: '車',
-            PieceType.CANNON: '砲',
-            PieceType.SOLDIER: '卒'
-        }
-        
-        if self.color == 'red':
-            return piece_chars[self.type]
-        else:
-            return black_piece_chars[self.type]
+        return self.glyph
+
+# 扁平棋盘: 90个格子, 下标 sq = row * 9 + col
+BOARD_ROWS = 10
+BOARD_COLS = 9
+BOARD_SIZE = 90
+
+# 棋子编码: 低3位为兵种, 第4位为颜色 (0红 8黑), 0表示空格
+EMPTY = 0
+GENERAL = 1
+ADVISOR = 2
+ELEPHANT = 3
+HORSE = 4
+CHARIOT = 5
+CANNON = 6
+SOLDIER = 7
+TYPE_MASK = 7
+RED = 0
+BLACK = 8
+COLOR_MASK = 8
+
+COLOR_BITS = {'red': RED, 'black': BLACK}
+COLOR_NAMES = {RED: 'red', BLACK: 'black'}
+
+PIECE_TYPES = (None, PieceType.GENERAL, PieceType.ADVISOR, PieceType.ELEPHANT,
+               PieceType.HORSE, PieceType.CHARIOT, PieceType.CANNON, PieceType.SOLDIER)
+TYPE_CODES = {piece_type: code for code, piece_type in enumerate(PIECE_TYPES) if piece_type}
+
+# FEN 字母 -> 棋子编码, 大写为红方; 解析时兼容 E/H 写法的象和马
+FEN_CODES = {}
+for _code, _char in ((GENERAL, 'k'), (ADVISOR, 'a'), (ELEPHANT, 'b'), (HORSE, 'n'),
+                     (CHARIOT, 'r'), (CANNON, 'c'), (SOLDIER, 'p'), (ELEPHANT, 'e'), (HORSE, 'h')):
+    FEN_CODES[_char.upper()] = RED | _code
+    FEN_CODES[_char] = BLACK | _code
+del _code, _char
+FEN_CHARS = tuple(' KABNRCP kabnrcp'[code] if code & TYPE_MASK else '' for code in range(16))
+
+START_FEN = 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w - - 0 1'
+
+# Zobrist随机数: 固定种子, 保证客户端与服务器得到相同的局面键
+_zobrist_random = random.Random(0x5A0B2157)
+ZOBRIST_PIECES = tuple(
+    tuple(_zobrist_random.getrandbits(64) for _ in range(BOARD_SIZE)) if code & TYPE_MASK else (0,) * BOARD_SIZE
+    for code in range(16)
+)
+ZOBRIST_SIDE = _zobrist_random.getrandbits(64)  # 轮到黑方走时异或
+del _zobrist_random
+
+# ---- 左右镜像: 象棋局面左右对称, 缓存可以只存镜像对中的一个 ----
+
+MIRROR_SQUARES = tuple(sq - sq % BOARD_COLS + BOARD_COLS - 1 - sq % BOARD_COLS for sq in range(BOARD_SIZE))
+# 镜像局面的Zobrist键: MIRROR_ZOBRIST_PIECES[code][sq] 为 sq 镜像格上的随机数
+MIRROR_ZOBRIST_PIECES = tuple(
+    tuple(keys[MIRROR_SQUARES[sq]] for sq in range(BOARD_SIZE)) for keys in ZOBRIST_PIECES
+)
+
+# ---- 跳子类棋子(将/士/象/马/兵)的走法表, 导入时一次性生成 ----
+
+def _on_board(row, col):
+    return 0 <= row < BOARD_ROWS and 0 <= col < BOARD_COLS
+
+def _in_palace(side, row, col):
+    low, high = (7, 9) if side == RED else (0, 2)
+    return low <= row <= high and 3 <= col <= 5
+
+def _own_half(side, row):
+    return row >= 5 if side == RED else row <= 4
+
+def _build_leaper_tables():
+    """生成按格子索引的跳子走法表, 各表按 [side >> 3][sq] 访问 (马不分颜色)"""
+    general, advisor, elephant, soldier = [], [], [], []
+    for side in (RED, BLACK):
+        general_side, advisor_side, elephant_side, soldier_side = [], [], [], []
+        forward = -1 if side == RED else 1
+        for sq in range(BOARD_SIZE):
+            row, col = divmod(sq, BOARD_COLS)
+            general_side.append(tuple(
+                (row + dr) * 9 + col + dc for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1))
+                if _in_palace(side, row + dr, col + dc)))
+            advisor_side.append(tuple(
+                (row + dr) * 9 + col + dc for dr, dc in ((-1, -1), (-1, 1), (1, -1), (1, 1))
+                if _in_palace(side, row + dr, col + dc)))
+            # 象: (目标格, 象眼), 不能过河
+            elephant_side.append(tuple(
+                ((row + dr) * 9 + col + dc, (row + dr // 2) * 9 + col + dc // 2)
+                for dr, dc in ((-2, -2), (-2, 2), (2, -2), (2, 2))
+                if _on_board(row + dr, col + dc) and _own_half(side, row + dr)))
+            # 兵: 向前一步, 过河后可以左右移动
+            steps = [(forward, 0)]
+            if not _own_half(side, row):
+                steps += [(0, -1), (0, 1)]
+            soldier_side.append(tuple(
+                (row + dr) * 9 + col + dc for dr, dc in steps if _on_board(row + dr, col + dc)))
+        general.append(tuple(general_side))
+        advisor.append(tuple(advisor_side))
+        elephant.append(tuple(elephant_side))
+        soldier.append(tuple(soldier_side))
+
+    # 马: (目标格, 马腿), 马腿在长边方向的相邻格
+    horse = []
+    for sq in range(BOARD_SIZE):
+        row, col = divmod(sq, BOARD_COLS)
+        horse.append(tuple(
+            ((row + dr) * 9 + col + dc,
+             (row + dr // 2) * 9 + col if abs(dr) == 2 else row * 9 + col + dc // 2)
+            for dr, dc in ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+            if _on_board(row + dr, col + dc)))
+
+    return tuple(general), tuple(advisor), tuple(elephant), tuple(horse), tuple(soldier)
+
+GENERAL_STEPS, ADVISOR_STEPS, ELEPHANT_STEPS, HORSE_STEPS, SOLDIER_STEPS = _build_leaper_tables()
+
+# MOVABLE[side >> 3][code]: 目标格为空或为对方棋子时为1
+MOVABLE = tuple(
+    bytes(1 if not code or (code & COLOR_MASK) != side else 0 for code in range(16))
+    for side in (RED, BLACK)
+)
+
+# ---- 车炮的行/列占位查表 ----
+# 行占位为9位 (bit col), 列占位为10位 (bit row)。
+# SLIDES[pos][occ] = (不吃子的目标, 车可吃的格, 炮可吃的格), 其中的值为线内偏移:
+# 横向为列号, 纵向为 行号 * 9, 加上该线的起点即得格子下标。
+
+def _build_slide_table(length, stride):
+    table = []
+    interned = {}
+    for pos in range(length):
+        entries = []
+        for occ in range(1 << length):
+            quiet, chariot_caps, cannon_caps = [], [], []
+            for step in (-1, 1):
+                i = pos + step
+                while 0 <= i < length and not occ >> i & 1:
+                    quiet.append(i * stride)
+                    i += step
+                if 0 <= i < length:
+                    chariot_caps.append(i * stride)
+                    i += step
+                    while 0 <= i < length and not occ >> i & 1:
+                        i += step
+                    if 0 <= i < length:
+                        cannon_caps.append(i * stride)
+            entry = (tuple(quiet), tuple(chariot_caps), tuple(cannon_caps))
+            entries.append(interned.setdefault(entry, entry))
+        table.append(tuple(entries))
+    return tuple(table)
+
+RANK_SLIDES = _build_slide_table(BOARD_COLS, 1)
+FILE_SLIDES = _build_slide_table(BOARD_ROWS, BOARD_COLS)
+
+# 棋子槽位: 每方16个, 红方 0-15, 黑方 16-31, 每方第一个槽位固定为将帅
+SIDE_SLOTS = 16
+NO_SQUARE = 255  # 槽位上的棋子已被吃
+NO_SLOT = 255  # 格子上没有棋子
+SLOT_ORDER = (GENERAL, ADVISOR, ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER)
+
+# 走法编码: 16位整数, 高8位为起点格, 低8位为终点格
+def encode_move(from_sq, to_sq):
+    """把起点格和终点格打包成走法编码"""
+    return from_sq << 8 | to_sq
+
+def move_from(move):
+    """走法编码的起点格"""
+    return move >> 8
+
+def move_to(move):
+    """走法编码的终点格"""
+    return move & 255
+
+def mirror_move(move):
+    """左右镜像一步走法编码"""
+    return MIRROR_SQUARES[move >> 8] << 8 | MIRROR_SQUARES[move & 255]
+
+def canonical_move(move, mirrored):
+    """在实际局面和规范局面之间转换走法: mirrored 为 canonical_form() 返回的标志
+
+    镜像是自逆的, 存入缓存和从缓存取出都用这个函数。
+    """
+    return mirror_move(move) if mirrored else move
+
+def mirror_fen(fen):
+    """左右镜像一个 FEN 局面 (每行的数字都是个位数, 直接把每行倒过来即可)"""
+    fields = fen.split(' ', 1)
+    fields[0] = '/'.join(rank[::-1] for rank in fields[0].split('/'))
+    return ' '.join(fields)
+
+def move_to_iccs(move):
+    """走法编码转为ICCS坐标, 如 h2e2 (列 a-i, 行 0-9 从红方底线算起)"""
+    from_sq, to_sq = move >> 8, move & 255
+    return '%s%d%s%d' % ('abcdefghi'[from_sq % 9], 9 - from_sq // 9,
+                         'abcdefghi'[to_sq % 9], 9 - to_sq // 9)
+
+def iccs_to_move(text):
+    """ICCS坐标转为走法编码"""
+    text = text.strip().lower()
+    if len(text) != 4 or text[0] not in 'abcdefghi' or text[2] not in 'abcdefghi' \
+            or not text[1].isdigit() or not text[3].isdigit():
+        raise ValueError('无效的ICCS走法: %r' % text)
+    from_sq = (9 - int(text[1])) * 9 + 'abcdefghi'.index(text[0])
+    to_sq = (9 - int(text[3])) * 9 + 'abcdefghi'.index(text[2])
+    return from_sq << 8 | to_sq
+
+# 悔棋栈每项为 走法编码 | 撤销信息 << 16, 初始容量足够一整局, 不够时翻倍
+HISTORY_CAPACITY = 512
+
+# 按兵种的子力价值 (用于判断捉子等), 将帅取一个足够大的值
+PIECE_VALUES = (0, 10000, 20, 20, 40, 90, 45, 10)
+
+# MVV-LVA 吃子排序分: MVV_LVA[被吃兵种][吃子兵种], 先吃价值高的, 同价值先用便宜的子吃
+MVV_LVA = tuple(tuple(PIECE_VALUES[victim] * 16 - attacker for attacker in range(8)) for victim in range(8))
+
+# 同一局面出现该次数时按长将/长捉规则判定
+REPETITION_LIMIT = 3
+
+# 重复检测用的计数表: 按局面键低位计数, 非零冲突时再回查键历史
+# 每局只占 2KB, 重新载入局面时用 EMPTY_KEY_FILTER 原地清零
+REPETITION_MASK = 1023
+EMPTY_KEY_FILTER = array('H', bytes(2 * (REPETITION_MASK + 1)))
+
+SQ_ROW = tuple(sq // BOARD_COLS for sq in range(BOARD_SIZE))
+SQ_COL = tuple(sq % BOARD_COLS for sq in range(BOARD_SIZE))
+SQ_COORDS = tuple(divmod(sq, BOARD_COLS) for sq in range(BOARD_SIZE))  # sq -> (row, col)
+
+# ---- 攻击检测用的反向表: ATTACKS[T] 为能走到T的起点格 ----
+
+def _reverse_steps(table):
+    reverse = [[] for _ in range(BOARD_SIZE)]
+    for sq in range(BOARD_SIZE):
+        for entry in table[sq]:
+            if isinstance(entry, tuple):
+                to, block = entry
+                reverse[to].append((sq, block))
+            else:
+                reverse[entry].append(sq)
+    return tuple(tuple(entries) for entries in reverse)
+
+GENERAL_ATTACKS = tuple(_reverse_steps(table) for table in GENERAL_STEPS)
+ADVISOR_ATTACKS = tuple(_reverse_steps(table) for table in ADVISOR_STEPS)
+ELEPHANT_ATTACKS = tuple(_reverse_steps(table) for table in ELEPHANT_STEPS)
+HORSE_ATTACKS = _reverse_steps(HORSE_STEPS)  # (马的位置, 马腿)
+SOLDIER_ATTACKS = tuple(_reverse_steps(table) for table in SOLDIER_STEPS)
+
+# 马腿集合: 某格上的将帅可能被马将军时, 对应马腿所在的格
+HORSE_CHECK_LEGS = tuple(frozenset(leg for _, leg in HORSE_ATTACKS[sq]) for sq in range(BOARD_SIZE))
+
+# PIECES[code]: 14 个共享的棋子享元, 空格与无效编码为 None
+PIECES = tuple(Piece(PIECE_TYPES[code & TYPE_MASK], COLOR_NAMES[code & COLOR_MASK]) if code & TYPE_MASK else None
+               for code in range(16))
+
+def piece_from_code(code):
+    """棋子编码对应的共享Piece对象, 空格返回 None"""
+    return PIECES[code]
+
+class BoardRow:
+    """棋盘某一行的只读视图"""
+    __slots__ = ('_squares', '_base')
+
+    def __init__(self, squares, row):
+        self._squares = squares
+        self._base = row * BOARD_COLS
+
+    def __getitem__(self, col):
+        if not 0 <= col < BOARD_COLS:
+            raise IndexError(col)
+        return PIECES[self._squares[self._base + col]]
+
+    def __len__(self):
+        return BOARD_COLS
+
+    def __iter__(self):
+        for col in range(BOARD_COLS):
+            yield self[col]
+
+class BoardView:
+    """board[row][col] 兼容视图，底层数据为扁平的棋子编码数组"""
+    __slots__ = ('_rows',)
+
+    def __init__(self, squares):
+        self._rows = tuple(BoardRow(squares, row) for row in range(BOARD_ROWS))
+
+    def __getitem__(self, row):
+        return self._rows[row]
+
+    def __len__(self):
+        return BOARD_ROWS
+
+    def __iter__(self):
+        return iter(self._rows)
 
 class ChineseChess:
     def __init__(self):
+        self._allocate()
+        self.initialize_board()
+
+    def _allocate(self):
+        """分配棋盘和各个数组, 不载入局面"""
         # 游戏状态
-        self.board = [[None for _ in range(9)] for _ in range(10)]
+        self.squares = bytearray(BOARD_SIZE)
+        self.board = BoardView(self.squares)
         self.current_player = 'red'
         self.selected_piece = None
         self.game_status = 'playing'
         self.valid_moves = []
-        self.move_history = []  # 用于悔棋的移动历史
-        
-        self.initialize_board()
-    
+        self.history = array('i', bytes(4 * HISTORY_CAPACITY))  # 用于悔棋的移动历史
+        self.history_len = 0
+        self.key_history = array('Q', bytes(8 * (HISTORY_CAPACITY + 1)))  # 每步之后的局面键
+        self.key_filter = array('H', EMPTY_KEY_FILTER)  # 局面键低位 -> 历史中的出现次数
+        self.zobrist_key = 0
+        self.mirror_key = 0  # 左右镜像局面的Zobrist键
+        self.rank_occ = [0] * BOARD_ROWS  # 每行的占位位图
+        self.file_occ = [0] * BOARD_COLS  # 每列的占位位图
+        self.piece_squares = bytearray([NO_SQUARE]) * (2 * SIDE_SLOTS)  # 槽位 -> 所在格
+        self.square_slots = bytearray([NO_SLOT]) * BOARD_SIZE  # 格子 -> 槽位
+        self.start_player = 'red'  # 载入局面时的轮走方和 FEN 回合计数
+        self.start_halfmove = 0
+        self.start_fullmove = 1
+
     def initialize_board(self):
         """初始化棋盘"""
-        # 黑方棋子 (上方)
-        black_setup = [
-            ['車', '馬', '象', '士', '将', '士', '象', '馬', '車'],
-            [None, None, None, None, None, None, None, None, None],
-            [None, '砲', None, None, None, None, None, '砲', None],
-            ['卒', None, '卒', None, '卒', None, '卒', None, '卒'],
-            [None, None, None, None, None, None, None, None, None]
-        ]
-        
-        # 红方棋子 (下方)
-        red_setup = [
-            [None, None, None, None, None, None, None, None, None],
-            ['兵', None, '兵', None, '兵', None, '兵', None, '兵'],
-            [None, '炮', None, None, None, None, None, '炮', None],
-            [None, None, None, None, None, None, None, None, None],
-            ['車', '馬', '相', '仕', '帅', '仕', '相', '馬', '車']
-        ]
-        
-        # 放置黑方棋子
-        for row in range(5):
-            for col in range(9):
-                if black_setup[row][col]:
-                    piece_map = {
-                        '車': PieceType.CHARIOT, '馬': PieceType.HORSE, '象': PieceType.ELEPHANT,
-                        '士': PieceType.ADVISOR, '将': PieceType.GENERAL, '砲': PieceType.CANNON,
-                        '卒': PieceType.SOLDIER
-                    }
-                    self.board[row][col] = Piece(piece_map[black_setup[row][col]], 'black', row, col)
-        
-        # 放置红方棋子
-        for row in range(5, 10):
-            for col in range(9):
-                if red_setup[row - 5][col]:
-                    piece_map = {
-                        '車': PieceType.CHARIOT, '馬': PieceType.HORSE, '相': PieceType.ELEPHANT,
-                        '仕': PieceType.ADVISOR, '帅': PieceType.GENERAL, '炮': PieceType.CANNON,
-                        '兵': PieceType.SOLDIER
-                    }
-                    self.board[row][col] = Piece(piece_map[red_setup[row - 5][col]], 'red', row, col)
-    
+        self.load_fen(START_FEN)
+
+    def reset(self):
+        """重新开始一局"""
+        self.load_fen(START_FEN)
+
+    def load_fen(self, fen):
+        """从 FEN 载入局面 (如 START_FEN), 清空悔棋历史"""
+        fields = fen.split()
+        if not fields:
+            raise ValueError('空的FEN')
+        ranks = fields[0].split('/')
+        if len(ranks) != BOARD_ROWS:
+            raise ValueError('FEN应有10行: %r' % fen)
+
+        squares = bytearray(BOARD_SIZE)
+        for row, rank in enumerate(ranks):
+            col = 0
+            for char in rank:
+                if char.isdigit():
+                    col += int(char)
+                else:
+                    code = FEN_CODES.get(char)
+                    if code is None or col >= BOARD_COLS:
+                        raise ValueError('FEN第%d行无效: %r' % (row + 1, rank))
+                    squares[row * 9 + col] = code
+                    col += 1
+            if col != BOARD_COLS:
+                raise ValueError('FEN第%d行应有9列: %r' % (row + 1, rank))
+
+        side = fields[1].lower() if len(fields) > 1 else 'w'
+        if side not in ('w', 'r', 'b'):
+            raise ValueError('FEN轮走方无效: %r' % fields[1])
+        try:
+            halfmove = int(fields[4]) if len(fields) > 4 else 0
+            fullmove = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError('FEN回合计数无效: %r' % fen)
+
+        self.load_squares(squares, 'black' if side == 'b' else 'red', halfmove, fullmove)
+
+    def load_squares(self, squares, color='red', halfmove=0, fullmove=1):
+        """从 90 格的棋子编码 (bytes/bytearray) 载入局面, 清空悔棋历史"""
+        if len(squares) != BOARD_SIZE:
+            raise ValueError('棋盘应有%d格' % BOARD_SIZE)
+
+        # 分配棋子槽位时会检查多将/超过16子, 出错则恢复原局面
+        previous = bytes(self.squares)
+        self.squares[:] = squares
+        try:
+            self._rebuild_piece_lists()
+        except ValueError:
+            self.squares[:] = previous
+            self._rebuild_piece_lists()
+            raise
+        self._rebuild_occupancy()
+        self.current_player = color
+        self.zobrist_key = self.compute_zobrist_key()
+        self.mirror_key = self.compute_zobrist_key(mirrored=True)
+        self.history_len = 0
+        self.key_history[0] = self.zobrist_key
+        self.key_filter[:] = EMPTY_KEY_FILTER
+        self.key_filter[self.zobrist_key & REPETITION_MASK] = 1
+        self.start_player = self.current_player
+        self.start_halfmove = halfmove
+        self.start_fullmove = max(fullmove, 1)
+        self.selected_piece = None
+        self.valid_moves = []
+        self.check_game_status()
+
+    def _load_position(self, squares, color, key, halfmove, fullmove):
+        """快速载入一个已知有效的局面 (供 Position 使用)
+
+        不检查棋盘、不判定对局状态, 局面键由调用方给出; 悔棋历史为空时只改动计数表中的两格。
+        """
+        if self.history_len:
+            self.history_len = 0
+            self.key_filter[:] = EMPTY_KEY_FILTER
+        else:
+            self.key_filter[self.zobrist_key & REPETITION_MASK] -= 1
+        self.key_filter[key & REPETITION_MASK] += 1
+        self.squares[:] = squares
+        self._rebuild_piece_lists()
+        self._rebuild_occupancy()
+        self.current_player = color
+        self.zobrist_key = key
+        self.mirror_key = self.compute_zobrist_key(mirrored=True)
+        self.key_history[0] = key
+        self.start_player = color
+        self.start_halfmove = halfmove
+        self.start_fullmove = max(fullmove, 1)
+        self.game_status = 'playing'
+
+    @classmethod
+    def from_fen(cls, fen):
+        """由 FEN 创建一局新游戏"""
+        # 不经过 __init__, 免得先载入一遍开局
+        game = cls.__new__(cls)
+        game._allocate()
+        game.load_fen(fen)
+        return game
+
+    # ---- 快照与复制: 只拷贝紧凑数组, 不复制棋子对象 ----
+
+    def clone(self):
+        """复制出一局独立的游戏 (含悔棋历史), 可在其上随意走子而不影响原局"""
+        game = self.__class__.__new__(self.__class__)
+        game.squares = bytearray(self.squares)
+        game.board = BoardView(game.squares)
+        game.current_player = self.current_player
+        game.selected_piece = None
+        game.game_status = self.game_status
+        game.valid_moves = []
+        game.history = array('i', self.history)
+        game.history_len = self.history_len
+        game.key_history = array('Q', self.key_history)
+        game.key_filter = array('H', self.key_filter)
+        game.zobrist_key = self.zobrist_key
+        game.mirror_key = self.mirror_key
+        game.rank_occ = self.rank_occ[:]
+        game.file_occ = self.file_occ[:]
+        game.piece_squares = bytearray(self.piece_squares)
+        game.square_slots = bytearray(self.square_slots)
+        game.start_player = self.start_player
+        game.start_halfmove = self.start_halfmove
+        game.start_fullmove = self.start_fullmove
+        return game
+
+    def snapshot(self):
+        """生成当前局面的不可变快照 (全部为 bytes/str/int), 可跨线程共享或传给子进程"""
+        length = self.history_len
+        return (bytes(self.squares), bytes(self.piece_squares), self.current_player,
+                self.game_status, self.history[:length].tobytes(),
+                self.key_history[:length + 1].tobytes(),
+                self.start_player, self.start_halfmove, self.start_fullmove)
+
+    def restore(self, snapshot):
+        """恢复到 snapshot() 生成的快照"""
+        (squares, piece_squares, player, status, history, key_history,
+         start_player, start_halfmove, start_fullmove) = snapshot
+        self.squares[:] = squares
+        self.piece_squares[:] = piece_squares
+        square_slots = self.square_slots
+        square_slots[:] = bytearray([NO_SLOT]) * BOARD_SIZE
+        for slot, sq in enumerate(piece_squares):
+            if sq != NO_SQUARE:
+                square_slots[sq] = slot
+        self._rebuild_occupancy()
+
+        moves = array('i')
+        moves.frombytes(history)
+        keys = array('Q')
+        keys.frombytes(key_history)
+        length = len(moves)
+        capacity = max(HISTORY_CAPACITY, len(self.history))
+        while capacity < length:
+            capacity *= 2
+        self.history = moves + array('i', bytes(4 * (capacity - length)))
+        self.key_history = keys + array('Q', bytes(8 * (capacity - length)))
+        self.history_len = length
+        key_filter = self.key_filter
+        key_filter[:] = EMPTY_KEY_FILTER
+        for key in keys:
+            key_filter[key & REPETITION_MASK] += 1
+        self.zobrist_key = keys[length]
+
+        self.current_player = player
+        self.mirror_key = self.compute_zobrist_key(mirrored=True)
+        self.game_status = status
+        self.start_player = start_player
+        self.start_halfmove = start_halfmove
+        self.start_fullmove = start_fullmove
+        self.selected_piece = None
+        self.valid_moves = []
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """由快照创建一局新游戏"""
+        game = cls()
+        game.restore(snapshot)
+        return game
+
+    def to_fen(self):
+        """导出当前局面的 FEN (含轮走方和回合计数)"""
+        squares = self.squares
+        ranks = []
+        for row in range(BOARD_ROWS):
+            rank = ''
+            empty = 0
+            for code in squares[row * 9:row * 9 + 9]:
+                if code:
+                    if empty:
+                        rank += str(empty)
+                        empty = 0
+                    rank += FEN_CHARS[code]
+                else:
+                    empty += 1
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+
+        # 半回合计数: 距上次吃子的步数
+        history = self.history
+        halfmove = 0
+        index = self.history_len - 1
+        while index >= 0 and not history[index] >> 16:
+            halfmove += 1
+            index -= 1
+        if index < 0:
+            halfmove += self.start_halfmove
+
+        plies = self.history_len + (1 if self.start_player == 'black' else 0)
+        fullmove = self.start_fullmove + plies // 2
+        side = 'w' if self.current_player == 'red' else 'b'
+        return '%s %s - - %d %d' % ('/'.join(ranks), side, halfmove, fullmove)
+
+    def _rebuild_occupancy(self):
+        """根据棋盘重新计算行/列占位位图"""
+        rank_occ = self.rank_occ
+        file_occ = self.file_occ
+        rank_occ[:] = [0] * BOARD_ROWS
+        file_occ[:] = [0] * BOARD_COLS
+        for sq, code in enumerate(self.squares):
+            if code:
+                row, col = SQ_ROW[sq], SQ_COL[sq]
+                rank_occ[row] |= 1 << col
+                file_occ[col] |= 1 << row
+
+    def _rebuild_piece_lists(self):
+        """根据棋盘重新分配棋子槽位, 每方按将、士、象、马、车、炮、兵的顺序排列"""
+        squares = self.squares
+        piece_squares = self.piece_squares
+        square_slots = self.square_slots
+        piece_squares[:] = bytearray([NO_SQUARE]) * (2 * SIDE_SLOTS)
+        square_slots[:] = bytearray([NO_SLOT]) * BOARD_SIZE
+
+        # 先扫一遍棋盘按棋子编码分组, 组内按格子顺序
+        groups = [[] for _ in range(16)]
+        for sq, code in enumerate(squares):
+            if code:
+                groups[code].append(sq)
+
+        for side in (RED, BLACK):
+            base = (side >> 3) * SIDE_SLOTS
+            slot = base + 1
+            for piece_type in SLOT_ORDER:
+                for sq in groups[side | piece_type]:
+                    if piece_type == GENERAL:
+                        if piece_squares[base] != NO_SQUARE:
+                            raise ValueError('%s方有多个将帅' % ('红' if side == RED else '黑'))
+                        index = base
+                    else:
+                        if slot >= base + SIDE_SLOTS:
+                            raise ValueError('%s方棋子超过16个' % ('红' if side == RED else '黑'))
+                        index = slot
+                        slot += 1
+                    piece_squares[index] = sq
+                    square_slots[sq] = index
+
+    def _side_squares(self, side):
+        """side 方所有在盘棋子的格子"""
+        base = (side >> 3) * SIDE_SLOTS
+        return [sq for sq in self.piece_squares[base:base + SIDE_SLOTS] if sq != NO_SQUARE]
+
+    def get_piece_positions(self, color):
+        """获取某方所有棋子的位置 [(row, col), ...]"""
+        return [divmod(sq, 9) for sq in self._side_squares(COLOR_BITS[color])]
+
+    def get_general_position(self, color):
+        """获取某方将帅的位置, 已被吃时返回 None"""
+        sq = self._general_square(COLOR_BITS[color])
+        return divmod(sq, 9) if sq >= 0 else None
+
+    def compute_zobrist_key(self, mirrored=False):
+        """完整扫描棋盘计算Zobrist键 (仅用于初始化和校验), mirrored 时计算镜像局面的键"""
+        pieces = MIRROR_ZOBRIST_PIECES if mirrored else ZOBRIST_PIECES
+        key = 0
+        for sq, code in enumerate(self.squares):
+            if code:
+                key ^= pieces[code][sq]
+        if self.current_player == 'black':
+            key ^= ZOBRIST_SIDE
+        return key
+
+    def position_key(self):
+        """获取当前局面的64位Zobrist键"""
+        return self.zobrist_key
+
+    def canonical_form(self):
+        """规范局面键: 返回 (键, mirrored)
+
+        局面与其左右镜像取键较小的一个作为规范形式, mirrored 表示规范形式是镜像局面,
+        此时缓存中的走法要用 canonical_move() 转换。对称局面 mirrored 为 False。
+        """
+        if self.mirror_key < self.zobrist_key:
+            return self.mirror_key, True
+        return self.zobrist_key, False
+
+    def canonical_key(self):
+        """规范局面键, 镜像对称的两个局面得到相同的键"""
+        return min(self.zobrist_key, self.mirror_key)
+
+    def mirrored(self):
+        """返回左右镜像后的新对局 (不含悔棋历史)"""
+        return self.__class__.from_fen(mirror_fen(self.to_fen()))
+
     def is_in_palace(self, color, row, col):
         """检查是否在宫殿内"""
         if color == 'red':
             return 7 <= row <= 9 and 3 <= col <= 5
         else:
             return 0 <= row <= 2 and 3 <= col <= 5
-    
-    def get_general_moves(self, row, col, color):
-        """将帅的移动"""
+
+    # ---- 基于扁平数组的走法生成, 返回目标格下标 ----
+
+    def _general_targets(self, sq, side):
+        """将帅的目标格"""
+        squares = self.squares
+        movable = MOVABLE[side >> 3]
+        return [to for to in GENERAL_STEPS[side >> 3][sq] if movable[squares[to]]]
+
+    def _advisor_targets(self, sq, side):
+        """士的目标格"""
+        squares = self.squares
+        movable = MOVABLE[side >> 3]
+        return [to for to in ADVISOR_STEPS[side >> 3][sq] if movable[squares[to]]]
+
+    def _elephant_targets(self, sq, side):
+        """象的目标格"""
+        squares = self.squares
+        movable = MOVABLE[side >> 3]
+        return [to for to, eye in ELEPHANT_STEPS[side >> 3][sq] if not squares[eye] and movable[squares[to]]]
+
+    def _horse_targets(self, sq, side):
+        """马的目标格"""
+        squares = self.squares
+        movable = MOVABLE[side >> 3]
+        return [to for to, leg in HORSE_STEPS[sq] if not squares[leg] and movable[squares[to]]]
+
+    def _chariot_targets(self, sq, side):
+        """车的目标格"""
+        squares = self.squares
+        movable = MOVABLE[side >> 3]
+        row, col = SQ_ROW[sq], SQ_COL[sq]
+        rank_base = sq - col
+
+        quiet, captures, _ = RANK_SLIDES[col][self.rank_occ[row]]
+        targets = [rank_base + offset for offset in quiet]
+        for offset in captures:
+            if movable[squares[rank_base + offset]]:
+                targets.append(rank_base + offset)
+
+        quiet, captures, _ = FILE_SLIDES[row][self.file_occ[col]]
+        targets += [col + offset for offset in quiet]
+        for offset in captures:
+            if movable[squares[col + offset]]:
+                targets.append(col + offset)
+
+        return targets
+
+    def _cannon_targets(self, sq, side):
+        """炮的目标格"""
+        squares = self.squares
+        movable = MOVABLE[side >> 3]
+        row, col = SQ_ROW[sq], SQ_COL[sq]
+        rank_base = sq - col
+
+        quiet, _, captures = RANK_SLIDES[col][self.rank_occ[row]]
+        targets = [rank_base + offset for offset in quiet]
+        for offset in captures:
+            if movable[squares[rank_base + offset]]:
+                targets.append(rank_base + offset)
+
+        quiet, _, captures = FILE_SLIDES[row][self.file_occ[col]]
+        targets += [col + offset for offset in quiet]
+        for offset in captures:
+            if movable[squares[col + offset]]:
+                targets.append(col + offset)
+
+        return targets
+
+    def _soldier_targets(self, sq, side):
+        """兵卒的目标格"""
+        squares = self.squares
+        movable = MOVABLE[side >> 3]
+        return [to for to in SOLDIER_STEPS[side >> 3][sq] if movable[squares[to]]]
+
+    def _piece_targets(self, sq):
+        """获取sq上棋子的伪合法目标格"""
+        code = self.squares[sq]
+        if not code:
+            return []
+        return self._target_generators[code & TYPE_MASK](self, sq, code & COLOR_MASK)
+
+    _target_generators = (None, _general_targets, _advisor_targets, _elephant_targets,
+                          _horse_targets, _chariot_targets, _cannon_targets, _soldier_targets)
+
+    # ---- 只计数的查询: 不生成走法列表 ----
+
+    def _side_mobility(self, side):
+        """side 方伪合法走法的总数"""
+        squares = self.squares
+        index = side >> 3
+        movable = MOVABLE[index]
+        rank_occ, file_occ = self.rank_occ, self.file_occ
+        count = 0
+        for sq in self._side_squares(side):
+            piece_type = squares[sq] & TYPE_MASK
+            if piece_type == CHARIOT or piece_type == CANNON:
+                which = 1 if piece_type == CHARIOT else 2
+                row, col = SQ_ROW[sq], SQ_COL[sq]
+                rank_base = sq - col
+                rank = RANK_SLIDES[col][rank_occ[row]]
+                file = FILE_SLIDES[row][file_occ[col]]
+                count += len(rank[0]) + len(file[0])
+                for offset in rank[which]:
+                    count += movable[squares[rank_base + offset]]
+                for offset in file[which]:
+                    count += movable[squares[col + offset]]
+            elif piece_type == HORSE:
+                for to, leg in HORSE_STEPS[sq]:
+                    if not squares[leg]:
+                        count += movable[squares[to]]
+            elif piece_type == ELEPHANT:
+                for to, eye in ELEPHANT_STEPS[index][sq]:
+                    if not squares[eye]:
+                        count += movable[squares[to]]
+            else:
+                steps = (GENERAL_STEPS if piece_type == GENERAL else
+                         ADVISOR_STEPS if piece_type == ADVISOR else SOLDIER_STEPS)
+                for to in steps[index][sq]:
+                    count += movable[squares[to]]
+        return count
+
+    def mobility(self, color):
+        """某方伪合法走法的数量 (不检查送将), 用于评估"""
+        return self._side_mobility(COLOR_BITS[color])
+
+    def _attackers(self, sq, by):
+        """by 方所有攻击 sq 的棋子, 以格子位图返回 (bit sq)。不含将帅照面"""
+        squares = self.squares
+        index = by >> 3
+        row, col = SQ_ROW[sq], SQ_COL[sq]
+        rank_base = sq - col
+        mask = 0
+
+        _, chariot_caps, cannon_caps = RANK_SLIDES[col][self.rank_occ[row]]
+        for offset in chariot_caps:
+            if squares[rank_base + offset] == by | CHARIOT:
+                mask |= 1 << (rank_base + offset)
+        for offset in cannon_caps:
+            if squares[rank_base + offset] == by | CANNON:
+                mask |= 1 << (rank_base + offset)
+
+        _, chariot_caps, cannon_caps = FILE_SLIDES[row][self.file_occ[col]]
+        for offset in chariot_caps:
+            if squares[col + offset] == by | CHARIOT:
+                mask |= 1 << (col + offset)
+        for offset in cannon_caps:
+            if squares[col + offset] == by | CANNON:
+                mask |= 1 << (col + offset)
+
+        horse = by | HORSE
+        for origin, leg in HORSE_ATTACKS[sq]:
+            if squares[origin] == horse and not squares[leg]:
+                mask |= 1 << origin
+        elephant = by | ELEPHANT
+        for origin, eye in ELEPHANT_ATTACKS[index][sq]:
+            if squares[origin] == elephant and not squares[eye]:
+                mask |= 1 << origin
+        for table, code in ((SOLDIER_ATTACKS, by | SOLDIER), (ADVISOR_ATTACKS, by | ADVISOR),
+                            (GENERAL_ATTACKS, by | GENERAL)):
+            for origin in table[index][sq]:
+                if squares[origin] == code:
+                    mask |= 1 << origin
+        return mask
+
+    def attackers(self, square, color):
+        """攻击 square 格 (row, col) 的 color 方棋子位图, 第 row * 9 + col 位对应一格
+
+        己方棋子所在格同样适用, 此时得到的是保护它的棋子。
+        """
+        row, col = square
+        return self._attackers(row * 9 + col, COLOR_BITS[color])
+
+    def attacker_count(self, square, color):
+        """攻击 square 格 (row, col) 的 color 方棋子数"""
+        return bin(self.attackers(square, color)).count('1')
+
+    # ---- 将军检测与合法走法 ----
+
+    def _general_square(self, side):
+        """将帅所在格, 不在棋盘上时返回 -1"""
+        sq = self.piece_squares[(side >> 3) * SIDE_SLOTS]
+        return sq if sq != NO_SQUARE else -1
+
+    def _is_attacked(self, sq, by):
+        """sq 是否受到 by 方棋子的攻击 (不含对面将帅)"""
+        squares = self.squares
+        row, col = SQ_ROW[sq], SQ_COL[sq]
+        chariot, cannon = by | CHARIOT, by | CANNON
+        rank_base = sq - col
+
+        _, chariot_caps, cannon_caps = RANK_SLIDES[col][self.rank_occ[row]]
+        for offset in chariot_caps:
+            if squares[rank_base + offset] == chariot:
+                return True
+        for offset in cannon_caps:
+            if squares[rank_base + offset] == cannon:
+                return True
+
+        _, chariot_caps, cannon_caps = FILE_SLIDES[row][self.file_occ[col]]
+        for offset in chariot_caps:
+            if squares[col + offset] == chariot:
+                return True
+        for offset in cannon_caps:
+            if squares[col + offset] == cannon:
+                return True
+
+        horse = by | HORSE
+        for origin, leg in HORSE_ATTACKS[sq]:
+            if squares[origin] == horse and not squares[leg]:
+                return True
+
+        index = by >> 3
+        soldier = by | SOLDIER
+        for origin in SOLDIER_ATTACKS[index][sq]:
+            if squares[origin] == soldier:
+                return True
+
+        general = by | GENERAL
+        for origin in GENERAL_ATTACKS[index][sq]:
+            if squares[origin] == general:
+                return True
+
+        advisor = by | ADVISOR
+        for origin in ADVISOR_ATTACKS[index][sq]:
+            if squares[origin] == advisor:
+                return True
+
+        elephant = by | ELEPHANT
+        for origin, eye in ELEPHANT_ATTACKS[index][sq]:
+            if squares[origin] == elephant and not squares[eye]:
+                return True
+
+        return False
+
+    def _least_attacker(self, sq, by):
+        """by 方攻击 sq 的棋子中价值最低者所在的格子, 没有则返回 -1 (不含将帅照面)"""
+        squares = self.squares
+        index = by >> 3
+
+        soldier = by | SOLDIER
+        for origin in SOLDIER_ATTACKS[index][sq]:
+            if squares[origin] == soldier:
+                return origin
+
+        advisor = by | ADVISOR
+        for origin in ADVISOR_ATTACKS[index][sq]:
+            if squares[origin] == advisor:
+                return origin
+
+        elephant = by | ELEPHANT
+        for origin, eye in ELEPHANT_ATTACKS[index][sq]:
+            if squares[origin] == elephant and not squares[eye]:
+                return origin
+
+        horse = by | HORSE
+        for origin, leg in HORSE_ATTACKS[sq]:
+            if squares[origin] == horse and not squares[leg]:
+                return origin
+
+        # 车炮: 先找炮再找车, 炮架随吃子出现或消失由占位位图自动反映
+        row, col = SQ_ROW[sq], SQ_COL[sq]
+        rank_base = sq - col
+        _, rank_chariot, rank_cannon = RANK_SLIDES[col][self.rank_occ[row]]
+        _, file_chariot, file_cannon = FILE_SLIDES[row][self.file_occ[col]]
+        cannon = by | CANNON
+        for offset in rank_cannon:
+            if squares[rank_base + offset] == cannon:
+                return rank_base + offset
+        for offset in file_cannon:
+            if squares[col + offset] == cannon:
+                return col + offset
+        chariot = by | CHARIOT
+        for offset in rank_chariot:
+            if squares[rank_base + offset] == chariot:
+                return rank_base + offset
+        for offset in file_chariot:
+            if squares[col + offset] == chariot:
+                return col + offset
+
+        general = by | GENERAL
+        for origin in GENERAL_ATTACKS[index][sq]:
+            if squares[origin] == general:
+                return origin
+        return -1
+
+    def _general_attacked(self, sq, side):
+        """位于 sq 的 side 方将帅是否被将军 (含将帅照面)"""
+        squares = self.squares
+        by = side ^ COLOR_MASK
+        row, col = SQ_ROW[sq], SQ_COL[sq]
+        chariot, cannon = by | CHARIOT, by | CANNON
+        rank_base = sq - col
+
+        _, chariot_caps, cannon_caps = RANK_SLIDES[col][self.rank_occ[row]]
+        for offset in chariot_caps:
+            if squares[rank_base + offset] == chariot:
+                return True
+        for offset in cannon_caps:
+            if squares[rank_base + offset] == cannon:
+                return True
+
+        # 纵线上第一个棋子是对方车或将帅 (照面) 都算将军
+        _, chariot_caps, cannon_caps = FILE_SLIDES[row][self.file_occ[col]]
+        general = by | GENERAL
+        for offset in chariot_caps:
+            code = squares[col + offset]
+            if code == chariot or code == general:
+                return True
+        for offset in cannon_caps:
+            if squares[col + offset] == cannon:
+                return True
+
+        horse = by | HORSE
+        for origin, leg in HORSE_ATTACKS[sq]:
+            if squares[origin] == horse and not squares[leg]:
+                return True
+
+        soldier = by | SOLDIER
+        for origin in SOLDIER_ATTACKS[by >> 3][sq]:
+            if squares[origin] == soldier:
+                return True
+
+        return False
+
+    def _in_check(self, side):
+        """side 方是否被将军"""
+        general_sq = self._general_square(side)
+        return general_sq >= 0 and self._general_attacked(general_sq, side)
+
+    def _leaves_general_attacked(self, from_sq, to_sq, side, general_sq):
+        """试走一步 (只改棋盘和占位), 判断走后己方将帅是否受攻击"""
+        squares = self.squares
+        rank_occ = self.rank_occ
+        file_occ = self.file_occ
+        piece = squares[from_sq]
+        captured = squares[to_sq]
+        from_row, from_col = SQ_ROW[from_sq], SQ_COL[from_sq]
+        to_row, to_col = SQ_ROW[to_sq], SQ_COL[to_sq]
+        from_rank, from_file = rank_occ[from_row], file_occ[from_col]
+        to_rank, to_file = rank_occ[to_row], file_occ[to_col]
+
+        squares[to_sq] = piece
+        squares[from_sq] = EMPTY
+        rank_occ[from_row] ^= 1 << from_col
+        file_occ[from_col] ^= 1 << from_row
+        rank_occ[to_row] |= 1 << to_col
+        file_occ[to_col] |= 1 << to_row
+
+        if piece & TYPE_MASK == GENERAL:
+            general_sq = to_sq
+        attacked = self._general_attacked(general_sq, side)
+
+        squares[from_sq] = piece
+        squares[to_sq] = captured
+        rank_occ[to_row], file_occ[to_col] = to_rank, to_file
+        rank_occ[from_row], file_occ[from_col] = from_rank, from_file
+        return attacked
+
+    def _legal_targets(self, sq):
+        """sq 上棋子不会送将的目标格"""
+        side = self.squares[sq] & COLOR_MASK
+        general_sq = self._general_square(side)
+        targets = self._piece_targets(sq)
+        if general_sq < 0:
+            return targets
+        return [to for to in targets if not self._leaves_general_attacked(sq, to, side, general_sq)]
+
+    def _legal_moves(self, side):
+        """side 方的全部合法走法, 返回走法编码列表"""
+        general_sq = self._general_square(side)
         moves = []
-        directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-        
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-            if self.is_in_palace(color, new_row, new_col):
-                if not self.board[new_row][new_col] or self.board[new_row][new_col].color != color:
-                    moves.append((new_row, new_col))
-        
+        if general_sq < 0:
+            for sq in self._side_squares(side):
+                moves += [sq << 8 | to for to in self._piece_targets(sq)]
+            return moves
+
+        # 不在将军中时, 只有与将帅同行同列、位于马腿上或走将帅本身的走法才可能送将
+        in_check = self._general_attacked(general_sq, side)
+        general_row, general_col = SQ_ROW[general_sq], SQ_COL[general_sq]
+        horse_legs = HORSE_CHECK_LEGS[general_sq]
+        leaves_attacked = self._leaves_general_attacked
+        for sq in self._side_squares(side):
+            targets = self._piece_targets(sq)
+            if (in_check or sq == general_sq or sq in horse_legs
+                    or SQ_ROW[sq] == general_row or SQ_COL[sq] == general_col):
+                moves += [sq << 8 | to for to in targets
+                          if not leaves_attacked(sq, to, side, general_sq)]
+            else:
+                for to in targets:
+                    if ((SQ_ROW[to] == general_row or SQ_COL[to] == general_col)
+                            and leaves_attacked(sq, to, side, general_sq)):
+                        continue
+                    moves.append(sq << 8 | to)
         return moves
-    
-    def get_advisor_moves(self, row, col, color):
-        """士的移动"""
+
+    # ---- 分阶段走法生成: 置换表走法 -> 吃子 -> 杀手走法 -> 其余不吃子走法 ----
+
+    def _capture_targets(self, sq):
+        """sq 上棋子能吃子的目标格 (伪合法)"""
+        squares = self.squares
+        code = squares[sq]
+        piece_type = code & TYPE_MASK
+        if piece_type != CHARIOT and piece_type != CANNON:
+            return [to for to in self._piece_targets(sq) if squares[to]]
+
+        # 车炮直接取占位表里的吃子格
+        which = 1 if piece_type == CHARIOT else 2
+        enemy = (code & COLOR_MASK) ^ COLOR_MASK
+        row, col = SQ_ROW[sq], SQ_COL[sq]
+        rank_base = sq - col
+        targets = [rank_base + offset for offset in RANK_SLIDES[col][self.rank_occ[row]][which]
+                   if squares[rank_base + offset] & COLOR_MASK == enemy]
+        targets += [col + offset for offset in FILE_SLIDES[row][self.file_occ[col]][which]
+                    if squares[col + offset] & COLOR_MASK == enemy]
+        return targets
+
+    def _quiet_targets(self, sq):
+        """sq 上棋子不吃子的目标格 (伪合法)"""
+        squares = self.squares
+        piece_type = squares[sq] & TYPE_MASK
+        if piece_type != CHARIOT and piece_type != CANNON:
+            return [to for to in self._piece_targets(sq) if not squares[to]]
+
+        row, col = SQ_ROW[sq], SQ_COL[sq]
+        rank_base = sq - col
+        targets = [rank_base + offset for offset in RANK_SLIDES[col][self.rank_occ[row]][0]]
+        targets += [col + offset for offset in FILE_SLIDES[row][self.file_occ[col]][0]]
+        return targets
+
+    def _needs_safety_check(self, from_sq, to_sq, general_sq, in_check):
+        """这步走法是否可能让己方将帅受攻击, 需要试走确认"""
+        if in_check or from_sq == general_sq or from_sq in HORSE_CHECK_LEGS[general_sq]:
+            return True
+        general_row, general_col = SQ_ROW[general_sq], SQ_COL[general_sq]
+        return (SQ_ROW[from_sq] == general_row or SQ_COL[from_sq] == general_col
+                or SQ_ROW[to_sq] == general_row or SQ_COL[to_sq] == general_col)
+
+    def _capture_moves(self, side):
+        """side 方的伪合法吃子走法, 按 MVV-LVA 从高到低排序"""
+        squares = self.squares
+        scored = []
+        for sq in self._side_squares(side):
+            attacker = squares[sq] & TYPE_MASK
+            for to in self._capture_targets(sq):
+                scored.append((MVV_LVA[squares[to] & TYPE_MASK][attacker], sq << 8 | to))
+        scored.sort(reverse=True)
+        return [move for _, move in scored]
+
+    def _quiet_moves(self, side):
+        """side 方的伪合法不吃子走法"""
         moves = []
-        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-        
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-            if self.is_in_palace(color, new_row, new_col):
-                if not self.board[new_row][new_col] or self.board[new_row][new_col].color != color:
-                    moves.append((new_row, new_col))
-        
+        for sq in self._side_squares(side):
+            moves += [sq << 8 | to for to in self._quiet_targets(sq)]
         return moves
-    
+
+    def _filter_legal(self, moves, side):
+        """从伪合法走法中去掉送将的走法"""
+        general_sq = self._general_square(side)
+        if general_sq < 0:
+            return moves
+        in_check = self._general_attacked(general_sq, side)
+        return [move for move in moves
+                if not self._needs_safety_check(move >> 8, move & 255, general_sq, in_check)
+                or not self._leaves_general_attacked(move >> 8, move & 255, side, general_sq)]
+
+    def generate_captures(self, color=None):
+        """生成合法吃子走法编码, 按 MVV-LVA 排序, 默认为当前玩家"""
+        side = COLOR_BITS[color or self.current_player]
+        return self._filter_legal(self._capture_moves(side), side)
+
+    def generate_quiets(self, color=None):
+        """生成合法不吃子走法编码, 默认为当前玩家"""
+        side = COLOR_BITS[color or self.current_player]
+        return self._filter_legal(self._quiet_moves(side), side)
+
+    def iter_moves(self, hash_move=0, killers=(), history=None):
+        """按阶段惰性产生当前玩家的合法走法
+
+        依次为: 置换表走法, MVV-LVA 排序的吃子, 杀手走法, 其余不吃子走法。
+        给出 history (按 from_sq * 90 + to_sq 索引的历史分表) 时其余不吃子走法按分数从高到低。
+        每个阶段只在前一阶段用完后才生成, 搜索中早早剪枝时后面的走法不必生成。
+        调用方可以在两次取值之间走子, 只要取下一步前已经撤销。
+        """
+        squares = self.squares
+        side = COLOR_BITS[self.current_player]
+        general_sq = self._general_square(side)
+        in_check = general_sq >= 0 and self._general_attacked(general_sq, side)
+
+        def is_safe(move):
+            from_sq, to_sq = move >> 8, move & 255
+            return (general_sq < 0
+                    or not self._needs_safety_check(from_sq, to_sq, general_sq, in_check)
+                    or not self._leaves_general_attacked(from_sq, to_sq, side, general_sq))
+
+        def is_playable(move):
+            from_sq, to_sq = move >> 8, move & 255
+            if from_sq >= BOARD_SIZE or to_sq >= BOARD_SIZE:
+                return False
+            code = squares[from_sq]
+            return code and (code & COLOR_MASK) == side and self._is_pseudo_legal(from_sq, to_sq)
+
+        # 置换表走法
+        if hash_move and is_playable(hash_move) and is_safe(hash_move):
+            yield hash_move
+
+        # 吃子
+        for move in self._capture_moves(side):
+            if move != hash_move and is_safe(move):
+                yield move
+
+        # 杀手走法 (只取不吃子的)
+        tried = [hash_move]
+        for move in killers:
+            if (move and move not in tried and is_playable(move)
+                    and not squares[move & 255] and is_safe(move)):
+                tried.append(move)
+                yield move
+
+        # 其余不吃子走法
+        quiets = self._quiet_moves(side)
+        if history is not None:
+            quiets.sort(key=lambda move: history[(move >> 8) * BOARD_SIZE + (move & 255)], reverse=True)
+        for move in quiets:
+            if move not in tried and is_safe(move):
+                yield move
+
+    def see(self, move):
+        """静态交换评估: 在目标格上双方轮流用最便宜的子吃回后, 走子方的子力得失
+
+        不吃子的走法给出走到该格后会不会被白白吃掉。每次吃子都在棋盘上实际走一步,
+        因此车炮背后的叠子以及炮架的出现和消失都会被计入。将帅只有在吃到该格后不被将军时才算吃回,
+        交换在将帅被吃时结束。不考虑其他棋子的牵制。
+        """
+        from_sq, to_sq = move >> 8, move & 255
+        squares = self.squares
+        gains = [PIECE_VALUES[squares[to_sq] & TYPE_MASK]]
+        piece_value = PIECE_VALUES[squares[from_sq] & TYPE_MASK]
+        side = (squares[from_sq] & COLOR_MASK) ^ COLOR_MASK
+        made = [(from_sq, self._make_move(from_sq, to_sq))]
+
+        while True:
+            if piece_value == PIECE_VALUES[GENERAL]:
+                # 将帅吃到该格后若仍受攻击 (含将帅照面), 记下对方吃将一步, 回推时这一吃自然被排除
+                if self._general_attacked(to_sq, side ^ COLOR_MASK):
+                    gains.append(piece_value - gains[-1])
+                break
+            attacker = self._least_attacker(to_sq, side)
+            if attacker < 0:
+                break
+            gains.append(piece_value - gains[-1])
+            piece_value = PIECE_VALUES[squares[attacker] & TYPE_MASK]
+            made.append((attacker, self._make_move(attacker, to_sq)))
+            side ^= COLOR_MASK
+
+        for origin, undo in reversed(made):
+            self._unmake_move(origin, to_sq, undo)
+
+        # 从交换末端往回推, 每一方都可以选择不再吃回
+        for index in range(len(gains) - 1, 0, -1):
+            gains[index - 1] = -max(-gains[index - 1], gains[index])
+        return gains[0]
+
+    def iter_captures(self):
+        """按 MVV-LVA 顺序惰性产生当前玩家的合法吃子走法, 供静态搜索使用"""
+        side = COLOR_BITS[self.current_player]
+        general_sq = self._general_square(side)
+        in_check = general_sq >= 0 and self._general_attacked(general_sq, side)
+        for move in self._capture_moves(side):
+            from_sq, to_sq = move >> 8, move & 255
+            if (general_sq < 0
+                    or not self._needs_safety_check(from_sq, to_sq, general_sq, in_check)
+                    or not self._leaves_general_attacked(from_sq, to_sq, side, general_sq)):
+                yield move
+
+    def _has_legal_move(self, side):
+        """side 方是否还有合法走法, 找到一步即返回"""
+        general_sq = self._general_square(side)
+        for sq in self._side_squares(side):
+            for to in self._piece_targets(sq):
+                if general_sq < 0 or not self._leaves_general_attacked(sq, to, side, general_sq):
+                    return True
+        return False
+
+    def is_in_check(self, color):
+        """检查某方是否被将军"""
+        return self._in_check(COLOR_BITS[color])
+
+    def generate_legal_moves(self, color):
+        """生成某方的全部合法走法, 返回 (from_row, from_col, to_row, to_col) 列表"""
+        return [(SQ_ROW[move >> 8], SQ_COL[move >> 8], SQ_ROW[move & 255], SQ_COL[move & 255])
+                for move in self._legal_moves(COLOR_BITS[color])]
+
+    def legal_moves(self, color=None):
+        """生成合法走法编码列表, 默认为当前玩家"""
+        return self._legal_moves(COLOR_BITS[color or self.current_player])
+
+    def perft(self, depth):
+        """统计从当前局面出发 depth 层的合法走法叶子节点数, 用于校验走法生成"""
+        moves = self.legal_moves()
+        if depth <= 1:
+            return len(moves) if depth == 1 else 1
+        nodes = 0
+        for move in moves:
+            self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.unmake_move()
+        return nodes
+
+    def perft_divide(self, depth):
+        """按第一步分别统计 perft, 返回 {ICCS走法: 节点数}"""
+        result = {}
+        for move in self.legal_moves():
+            self.make_move(move)
+            result[move_to_iccs(move)] = self.perft(depth - 1)
+            self.unmake_move()
+        return result
+
+    def is_checkmate(self, color):
+        """某方被将死"""
+        side = COLOR_BITS[color]
+        return self._in_check(side) and not self._has_legal_move(side)
+
+    def is_stalemate(self, color):
+        """某方未被将军但无子可动 (困毙, 同样判负)"""
+        side = COLOR_BITS[color]
+        return not self._in_check(side) and not self._has_legal_move(side)
+
+    # ---- 兼容旧接口的 (row, col) 走法 ----
+
+    def get_general_moves(self, row, col, color):
+        """将帅的移动"""
+        return [divmod(to, 9) for to in self._general_targets(row * 9 + col, COLOR_BITS[color])]
+
+    def get_advisor_moves(self, row, col, color):
+        """士的移动"""
+        return [divmod(to, 9) for to in self._advisor_targets(row * 9 + col, COLOR_BITS[color])]
+
     def get_elephant_moves(self, row, col, color):
         """象的移动"""
-        moves = []
-        directions = [(-2, -2), (-2, 2), (2, -2), (2, 2)]
-        
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-            
-            # 检查是否过河
-            if (color == 'red' and new_row < 5) or (color == 'black' and new_row > 4):
-                continue
-            
-            # 检查象眼是否被阻挡
-            block_row, block_col = row + dr // 2, col + dc // 2
-            if 0 <= block_row < 10 and 0 <= block_col < 9 and not self.board[block_row][block_col]:
-                if 0 <= new_row < 10 and 0 <= new_col < 9:
-                    if not self.board[new_row][new_col] or self.board[new_row][new_col].color != color:
-                        moves.append((new_row, new_col))
-        
-        return moves
-    
+        return [divmod(to, 9) for to in self._elephant_targets(row * 9 + col, COLOR_BITS[color])]
+
     def get_horse_moves(self, row, col, color):
         """马的移动"""
-        moves = []
-        directions = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
-                     (1, -2), (1, 2), (2, -1), (2, 1)]
-        
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-            
-            # 检查马腿是否被阻挡
-            block_row, block_col = 0, 0
-            if abs(dr) == 2:
-                block_row, block_col = row + dr // 2, col
-            else:
-                block_row, block_col = row, col + dc // 2
-            
-            if 0 <= block_row < 10 and 0 <= block_col < 9 and not self.board[block_row][block_col]:
-                if 0 <= new_row < 10 and 0 <= new_col < 9:
-                    if not self.board[new_row][new_col] or self.board[new_row][new_col].color != color:
-                        moves.append((new_row, new_col))
-        
-        return moves
-    
+        return [divmod(to, 9) for to in self._horse_targets(row * 9 + col, COLOR_BITS[color])]
+
     def get_chariot_moves(self, row, col, color):
         """车的移动"""
-        moves = []
-        directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-        
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-            while 0 <= new_row < 10 and 0 <= new_col < 9:
-                target_piece = self.board[new_row][new_col]
-                if target_piece:
-                    if target_piece.color != color:
-                        moves.append((new_row, new_col))
-                    break
-                moves.append((new_row, new_col))
-                new_row += dr
-                new_col += dc
-        
-        return moves
-    
+        return [divmod(to, 9) for to in self._chariot_targets(row * 9 + col, COLOR_BITS[color])]
+
     def get_cannon_moves(self, row, col, color):
         """炮的移动"""
-        moves = []
-        directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-        
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-            has_barrier = False
-            
-            while 0 <= new_row < 10 and 0 <= new_col < 9:
-                target_piece = self.board[new_row][new_col]
-                
-                if target_piece:
-                    if not has_barrier:
-                        has_barrier = True
-                    else:
-                        if target_piece.color != color:
-                            moves.append((new_row, new_col))
-                        break
-                elif not has_barrier:
-                    moves.append((new_row, new_col))
-                
-                new_row += dr
-                new_col += dc
-        
-        return moves
-    
+        return [divmod(to, 9) for to in self._cannon_targets(row * 9 + col, COLOR_BITS[color])]
+
     def get_soldier_moves(self, row, col, color):
         """兵卒的移动"""
-        moves = []
-        
-        if color == 'red':
-            # 红方兵
-            if row > 0:
-                if not self.board[row - 1][col] or self.board[row - 1][col].color != color:
-                    moves.append((row - 1, col))
-            
-            # 过河后可以左右移动
-            if row <= 4:  # 已过河
-                if col > 0 and (not self.board[row][col - 1] or self.board[row][col - 1].color != color):
-                    moves.append((row, col - 1))
-                if col < 8 and (not self.board[row][col + 1] or self.board[row][col + 1].color != color):
-                    moves.append((row, col + 1))
-        else:
-            # 黑方卒
-            if row < 9:
-                if not self.board[row + 1][col] or self.board[row + 1][col].color != color:
-                    moves.append((row + 1, col))
-            
-            # 过河后可以左右移动
-            if row >= 5:  # 已过河
-                if col > 0 and (not self.board[row][col - 1] or self.board[row][col - 1].color != color):
-                    moves.append((row, col - 1))
-                if col < 8 and (not self.board[row][col + 1] or self.board[row][col + 1].color != color):
-                    moves.append((row, col + 1))
-        
-        return moves
-    
+        return [divmod(to, 9) for to in self._soldier_targets(row * 9 + col, COLOR_BITS[color])]
+
     def get_valid_moves(self, row, col):
-        """获取棋子的合法移动"""
-        piece = self.board[row][col]
-        if not piece:
+        """获取棋子的合法移动 (伪合法, 不检查送将)"""
+        if not (0 <= row < 10 and 0 <= col < 9):
             return []
-        
-        moves = []
-        piece_type = piece.type
-        
-        # 根据棋子类型获取移动
-        if piece_type == PieceType.GENERAL:  # 将帅
-            moves = self.get_general_moves(row, col, piece.color)
-        elif piece_type == PieceType.ADVISOR:  # 士
-            moves = self.get_advisor_moves(row, col, piece.color)
-        elif piece_type == PieceType.ELEPHANT:  # 象
-            moves = self.get_elephant_moves(row, col, piece.color)
-        elif piece_type == PieceType.HORSE:  # 马
-            moves = self.get_horse_moves(row, col, piece.color)
-        elif piece_type == PieceType.CHARIOT:  # 车
-            moves = self.get_chariot_moves(row, col, piece.color)
-        elif piece_type == PieceType.CANNON:  # 炮
-            moves = self.get_cannon_moves(row, col, piece.color)
-        elif piece_type == PieceType.SOLDIER:  # 兵卒
-            moves = self.get_soldier_moves(row, col, piece.color)
-        
-        return moves
-    
-    def move_piece(self, from_row, from_col, to_row, to_col):
-        """移动棋子"""
-        piece = self.board[from_row][from_col]
-        if not piece:
+        sq = row * 9 + col
+        code = self.squares[sq]
+        if not code:
+            return []
+        # 直接查生成函数表, 坐标用预先算好的元组, 省去逐个 divmod
+        coords = SQ_COORDS
+        return [coords[to] for to in self._target_generators[code & TYPE_MASK](self, sq, code & COLOR_MASK)]
+
+    def get_legal_moves(self, row, col):
+        """获取棋子的合法移动 (排除送将和将帅照面)"""
+        if not (0 <= row < 10 and 0 <= col < 9) or not self.squares[row * 9 + col]:
+            return []
+        coords = SQ_COORDS
+        return [coords[to] for to in self._legal_targets(row * 9 + col)]
+
+    def _is_pseudo_legal(self, from_sq, to_sq):
+        """只按走法几何和阻挡判断 from_sq -> to_sq 是否可走, 不检查送将"""
+        squares = self.squares
+        piece = squares[from_sq]
+        side = piece & COLOR_MASK
+        index = side >> 3
+        if from_sq == to_sq or not MOVABLE[index][squares[to_sq]]:
+            return False
+
+        piece_type = piece & TYPE_MASK
+        if piece_type == CHARIOT or piece_type == CANNON:
+            from_row, from_col = SQ_ROW[from_sq], SQ_COL[from_sq]
+            to_row, to_col = SQ_ROW[to_sq], SQ_COL[to_sq]
+            if from_row == to_row:
+                occ, low, high = self.rank_occ[from_row], min(from_col, to_col), max(from_col, to_col)
+            elif from_col == to_col:
+                occ, low, high = self.file_occ[from_col], min(from_row, to_row), max(from_row, to_row)
+            else:
+                return False
+            # 起点和终点之间的棋子
+            between = occ & ((1 << high) - (1 << (low + 1)))
+            if piece_type == CHARIOT or not squares[to_sq]:
+                return not between
+            # 炮吃子需要恰好隔一个子
+            return bool(between) and not between & (between - 1)
+        if piece_type == HORSE:
+            for to, leg in HORSE_STEPS[from_sq]:
+                if to == to_sq:
+                    return not squares[leg]
+            return False
+        if piece_type == ELEPHANT:
+            for to, eye in ELEPHANT_STEPS[index][from_sq]:
+                if to == to_sq:
+                    return not squares[eye]
             return False
-        
+        if piece_type == GENERAL:
+            return to_sq in GENERAL_STEPS[index][from_sq]
+        if piece_type == ADVISOR:
+            return to_sq in ADVISOR_STEPS[index][from_sq]
+        return to_sq in SOLDIER_STEPS[index][from_sq]
+
+    def is_legal_move(self, from_row, from_col, to_row, to_col):
+        """检查当前玩家的一步走法是否合法: 走法几何、阻挡和送将, 不生成走法列表"""
+        if not (0 <= from_row < 10 and 0 <= from_col < 9 and 0 <= to_row < 10 and 0 <= to_col < 9):
+            return False
+        from_sq = from_row * 9 + from_col
+        to_sq = to_row * 9 + to_col
+        piece = self.squares[from_sq]
+
         # 检查是否是当前玩家的棋子
-        if piece.color != self.current_player:
+        if not piece or (piece & COLOR_MASK) != COLOR_BITS[self.current_player]:
             return False
-        
+
+        if not self._is_pseudo_legal(from_sq, to_sq):
+            return False
+
+        # 不能送将
+        side = piece & COLOR_MASK
+        general_sq = self._general_square(side)
+        return general_sq < 0 or not self._leaves_general_attacked(from_sq, to_sq, side, general_sq)
+
+    def move_piece(self, from_row, from_col, to_row, to_col):
+        """移动棋子, 不合法或对局已结束时返回 False"""
+        # 对局结束后不再接受走子
+        if self.game_status != 'playing':
+            return False
+
         # 检查移动是否合法
-        valid_moves = self.get_valid_moves(from_row, from_col)
-        if (to_row, to_col) not in valid_moves:
+        if not self.is_legal_move(from_row, from_col, to_row, to_col):
             return False
-        
-        # 保存移动前的状态用于悔棋
-        captured_piece = self.board[to_row][to_col]
-        move_info = {
-            'from_row': from_row,
-            'from_col': from_col,
-            'to_row': to_row,
-            'to_col': to_col,
-            'moved_piece': piece,
-            'captured_piece': captured_piece,
-            'current_player': self.current_player
-        }
-        self.move_history.append(move_info)
-        
-        # 执行移动
-        self.board[to_row][to_col] = piece
-        self.board[from_row][from_col] = None
-        piece.row = to_row
-        piece.col = to_col
-        
-        # 切换玩家
-        self.current_player = 'black' if self.current_player == 'red' else 'red'
-        
+
+        # 执行移动并记入悔棋栈
+        self.make_move(encode_move(from_row * 9 + from_col, to_row * 9 + to_col))
+
         # 检查游戏状态
         self.check_game_status()
-        
+
         return True
-    
+
+    def make_move(self, move):
+        """执行一步走法编码 (不做合法性检查) 并压入悔棋栈"""
+        history = self.history
+        length = self.history_len
+        if length == len(history):
+            self.key_history.extend(array('Q', bytes(8 * length)))
+            history.extend(history)
+        history[length] = move | self._make_move(move >> 8, move & 255) << 16
+        length += 1
+        self.history_len = length
+
+        key = self.zobrist_key
+        self.key_history[length] = key
+        self.key_filter[key & REPETITION_MASK] += 1
+
+    def unmake_move(self):
+        """弹出悔棋栈并撤销最后一步, 返回其走法编码"""
+        self.key_filter[self.zobrist_key & REPETITION_MASK] -= 1
+        self.history_len -= 1
+        entry = self.history[self.history_len]
+        move = entry & 0xFFFF
+        self._unmake_move(move >> 8, move & 255, entry >> 16)
+        return move
+
+    def make_null_move(self):
+        """空着: 不动子只交换轮走方, 供搜索的空着剪枝使用, 用 unmake_null_move 撤销"""
+        history = self.history
+        length = self.history_len
+        if length == len(history):
+            self.key_history.extend(array('Q', bytes(8 * length)))
+            history.extend(history)
+        history[length] = 0
+        length += 1
+        self.history_len = length
+
+        self.zobrist_key ^= ZOBRIST_SIDE
+        self.mirror_key ^= ZOBRIST_SIDE
+        self.current_player = 'black' if self.current_player == 'red' else 'red'
+        key = self.zobrist_key
+        self.key_history[length] = key
+        self.key_filter[key & REPETITION_MASK] += 1
+
+    def unmake_null_move(self):
+        """撤销 make_null_move"""
+        self.key_filter[self.zobrist_key & REPETITION_MASK] -= 1
+        self.history_len -= 1
+        self.zobrist_key ^= ZOBRIST_SIDE
+        self.mirror_key ^= ZOBRIST_SIDE
+        self.current_player = 'black' if self.current_player == 'red' else 'red'
+
+    # ---- 重复局面与长将/长捉 ----
+
+    def repetition_count(self):
+        """当前局面在本局中出现的次数 (含当前)"""
+        key = self.zobrist_key
+        if self.key_filter[key & REPETITION_MASK] < 2:
+            return 1
+        key_history = self.key_history
+        return sum(1 for index in range(self.history_len, -1, -2) if key_history[index] == key)
+
+    def is_repetition(self):
+        """当前局面是否曾出现过, 供搜索剪掉循环"""
+        key = self.zobrist_key
+        if self.key_filter[key & REPETITION_MASK] < 2:
+            return False
+        key_history = self.key_history
+        for index in range(self.history_len - 2, -1, -2):
+            if key_history[index] == key:
+                return True
+        return False
+
+    def _chases(self, from_sq, to_sq, before_targets):
+        """走到 to_sq 的棋子是否新捉了对方无根或价值更高的棋子
+
+        将帅和兵卒捉子不算犯规; 被捉的将帅与未过河兵也不算。
+        """
+        squares = self.squares
+        piece = squares[to_sq]
+        if piece & TYPE_MASK in (GENERAL, SOLDIER):
+            return False
+        side = piece & COLOR_MASK
+        enemy = side ^ COLOR_MASK
+        for target in self._piece_targets(to_sq):
+            victim = squares[target]
+            if not victim or target in before_targets:
+                continue
+            victim_type = victim & TYPE_MASK
+            if victim_type == GENERAL:
+                continue
+            if victim_type == SOLDIER and (SQ_ROW[target] >= 5) == (enemy == RED):
+                continue
+            if (PIECE_VALUES[victim_type] > PIECE_VALUES[piece & TYPE_MASK]
+                    or not self._is_attacked(target, enemy)):
+                return True
+        return False
+
+    def repetition_result(self):
+        """按长将/长捉规则判定当前的循环局面
+
+        当前局面未重复时返回 None; 否则返回 'red_wins', 'black_wins' 或 'draw'。
+        只在发现重复时回放一遍循环, 平时不增加走子开销。含空着的循环按和棋处理。
+        """
+        key = self.zobrist_key
+        if not self.is_repetition():
+            return None
+
+        # 找到上一次出现当前局面的位置, 循环为其后的这些走法
+        key_history = self.key_history
+        start = self.history_len - 2
+        while key_history[start] != key:
+            start -= 2
+        history = self.history
+        for index in range(start, self.history_len):
+            if not history[index] & 0xFFFF:
+                return 'draw'
+        cycle = []
+        while self.history_len > start:
+            cycle.append(self.unmake_move())
+        cycle.reverse()
+
+        # 回放循环, 记录每步是否将军、是否捉子
+        checks = {RED: True, BLACK: True}
+        chases = {RED: True, BLACK: True}
+        for move in cycle:
+            from_sq, to_sq = move >> 8, move & 255
+            side = self.squares[from_sq] & COLOR_MASK
+            before_targets = set(self._piece_targets(from_sq))
+            self.make_move(move)
+            if self._in_check(side ^ COLOR_MASK):
+                continue
+            checks[side] = False
+            if not self._chases(from_sq, to_sq, before_targets):
+                chases[side] = False
+
+        # 一方长将而另一方没有则长将方判负, 双方都长将或都不犯规为和;
+        # 长将之外再看长捉 (将捉交替也算长捉)
+        for flags in (checks, chases):
+            if flags[RED] != flags[BLACK]:
+                return 'black_wins' if flags[RED] else 'red_wins'
+            if flags[RED]:
+                return 'draw'
+        return 'draw'
+
+    @property
+    def move_history(self):
+        """已走的走法编码列表 (按顺序)"""
+        return [entry & 0xFFFF for entry in self.history[:self.history_len]]
+
+    def _make_move(self, from_sq, to_sq):
+        """在数组上执行一步走法 (不做合法性检查)
+
+        返回撤销信息: 被吃棋子编码 | 其槽位 << 4, 未吃子时为0
+        """
+        squares = self.squares
+        piece = squares[from_sq]
+        captured = squares[to_sq]
+        squares[to_sq] = piece
+        squares[from_sq] = EMPTY
+
+        square_slots = self.square_slots
+        undo = 0
+        if captured:
+            undo = captured | square_slots[to_sq] << 4
+            self.piece_squares[square_slots[to_sq]] = NO_SQUARE
+        slot = square_slots[from_sq]
+        self.piece_squares[slot] = to_sq
+        square_slots[to_sq] = slot
+        square_slots[from_sq] = NO_SLOT
+
+        from_row, from_col = SQ_ROW[from_sq], SQ_COL[from_sq]
+        self.rank_occ[from_row] ^= 1 << from_col
+        self.file_occ[from_col] ^= 1 << from_row
+        if not captured:
+            to_row, to_col = SQ_ROW[to_sq], SQ_COL[to_sq]
+            self.rank_occ[to_row] |= 1 << to_col
+            self.file_occ[to_col] |= 1 << to_row
+
+        self.zobrist_key ^= (ZOBRIST_PIECES[piece][from_sq] ^ ZOBRIST_PIECES[piece][to_sq]
+                             ^ ZOBRIST_PIECES[captured][to_sq] ^ ZOBRIST_SIDE)
+        self.mirror_key ^= (MIRROR_ZOBRIST_PIECES[piece][from_sq] ^ MIRROR_ZOBRIST_PIECES[piece][to_sq]
+                            ^ MIRROR_ZOBRIST_PIECES[captured][to_sq] ^ ZOBRIST_SIDE)
+
+        # 切换玩家
+        self.current_player = 'black' if self.current_player == 'red' else 'red'
+        return undo
+
+    def _unmake_move(self, from_sq, to_sq, undo):
+        """撤销 _make_move 执行的走法, undo 为其返回的撤销信息"""
+        squares = self.squares
+        piece = squares[to_sq]
+        captured = undo & 15
+        squares[from_sq] = piece
+        squares[to_sq] = captured
+
+        square_slots = self.square_slots
+        slot = square_slots[to_sq]
+        self.piece_squares[slot] = from_sq
+        square_slots[from_sq] = slot
+        if captured:
+            square_slots[to_sq] = undo >> 4
+            self.piece_squares[undo >> 4] = to_sq
+        else:
+            square_slots[to_sq] = NO_SLOT
+
+        from_row, from_col = SQ_ROW[from_sq], SQ_COL[from_sq]
+        self.rank_occ[from_row] |= 1 << from_col
+        self.file_occ[from_col] |= 1 << from_row
+        if not captured:
+            to_row, to_col = SQ_ROW[to_sq], SQ_COL[to_sq]
+            self.rank_occ[to_row] ^= 1 << to_col
+            self.file_occ[to_col] ^= 1 << to_row
+
+        self.zobrist_key ^= (ZOBRIST_PIECES[piece][from_sq] ^ ZOBRIST_PIECES[piece][to_sq]
+                             ^ ZOBRIST_PIECES[captured][to_sq] ^ ZOBRIST_SIDE)
+        self.mirror_key ^= (MIRROR_ZOBRIST_PIECES[piece][from_sq] ^ MIRROR_ZOBRIST_PIECES[piece][to_sq]
+                            ^ MIRROR_ZOBRIST_PIECES[captured][to_sq] ^ ZOBRIST_SIDE)
+
+        self.current_player = 'black' if self.current_player == 'red' else 'red'
+
     def undo_move(self):
         """悔棋"""
-        if not self.move_history:
+        if not self.history_len:
             return False
-        
-        # 获取最后一步移动
-        move_info = self.move_history.pop()
-        
-        # 恢复移动前的状态
-        from_row = move_info['from_row']
-        from_col = move_info['from_col']
-        to_row = move_info['to_row']
-        to_col = move_info['to_col']
-        moved_piece = move_info['moved_piece']
-        captured_piece = move_info['captured_piece']
-        
-        # 恢复棋子位置
-        self.board[from_row][from_col] = moved_piece
-        self.board[to_row][to_col] = captured_piece
-        moved_piece.row = from_row
-        moved_piece.col = from_col
-        
-        # 恢复当前玩家
-        self.current_player = move_info['current_player']
-        
+
+        # 恢复棋子位置和当前玩家
+        self.unmake_move()
+
         # 恢复游戏状态为进行中
         self.game_status = 'playing'
-        
+
         return True
-    
+
     def check_game_status(self):
         """检查游戏状态"""
-        # 简化版本：检查是否有将帅被吃掉
-        red_general = False
-        black_general = False
-        
-        for row in range(10):
-            for col in range(9):
-                piece = self.board[row][col]
-                if piece and piece.type == PieceType.GENERAL:
-                    if piece.color == 'red':
-                        red_general = True
-                    else:
-                        black_general = True
-        
-        if not red_general:
+        # 将帅被吃掉, 或轮走方被将死/困毙, 则对方获胜
+        if self._general_square(RED) < 0:
             self.game_status = 'black_wins'
-        elif not black_general:
+        elif self._general_square(BLACK) < 0:
             self.game_status = 'red_wins'
+        elif not self._has_legal_move(COLOR_BITS[self.current_player]):
+            self.game_status = 'black_wins' if self.current_player == 'red' else 'red_wins'
+        elif self.repetition_count() >= REPETITION_LIMIT:
+            # 循环局面: 长将、长捉方判负, 否则和棋
+            self.game_status = self.repetition_result()
         else:
             self.game_status = 'playing'
-    
+
     def get_game_status(self):
         """获取游戏状态"""
         return self.game_status
-    
+
     def get_current_player(self):
         """获取当前玩家"""
         return self.current_player
+
+
+class Position:
+    """不可变局面: 90 字节的棋盘加轮走方, apply(move) 返回新局面而不改动原局面
+
+    新局面通过 parent 指向上一个局面, 同一棵变例树中的局面共享走法历史。
+    走法生成借用每个线程各自的一局 ChineseChess, 因此可以在多线程中随意共享局面。
+    """
+    __slots__ = ('squares', 'color', 'key', 'parent', 'move', 'halfmove', 'fullmove')
+
+    _scratch = threading.local()
+
+    def __init__(self, squares, color='red', parent=None, move=0, key=None, halfmove=0, fullmove=1):
+        if len(squares) != BOARD_SIZE:
+            raise ValueError('棋盘应有%d格' % BOARD_SIZE)
+        squares = bytes(squares)
+        if key is None:
+            key = ZOBRIST_SIDE if color == 'black' else 0
+            for sq, code in enumerate(squares):
+                if code:
+                    key ^= ZOBRIST_PIECES[code][sq]
+        for name, value in (('squares', squares), ('color', color), ('key', key), ('parent', parent),
+                            ('move', move), ('halfmove', halfmove), ('fullmove', fullmove)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Position 不可修改')
+
+    def __delattr__(self, name):
+        raise AttributeError('Position 不可修改')
+
+    def __reduce__(self):
+        # pickle 和 copy 只保留局面本身, 不带 parent 链
+        return (Position, (self.squares, self.color, None, self.move, self.key,
+                           self.halfmove, self.fullmove))
+
+    def __eq__(self, other):
+        return (isinstance(other, Position) and self.key == other.key
+                and self.squares == other.squares and self.color == other.color)
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return 'Position(%r)' % self.to_fen()
+
+    @classmethod
+    def from_fen(cls, fen):
+        """由 FEN 创建局面"""
+        return cls.from_game(ChineseChess.from_fen(fen))
+
+    @classmethod
+    def from_game(cls, game):
+        """取 ChineseChess 的当前局面 (不含悔棋历史)"""
+        _, _, _, halfmove, fullmove = game.to_fen().split()[1:]
+        return cls(game.squares, game.current_player, key=game.zobrist_key,
+                   halfmove=int(halfmove), fullmove=int(fullmove))
+
+    def to_fen(self):
+        """导出 FEN"""
+        return self._engine().to_fen()
+
+    def to_game(self):
+        """转成一局可以走子的 ChineseChess (不含悔棋历史)"""
+        game = ChineseChess()
+        game.load_squares(self.squares, self.color, self.halfmove, self.fullmove)
+        return game
+
+    def _engine(self):
+        """本线程的临时对局, 已载入当前局面; 只能在本线程中立即使用
+
+        只记住载入的局面内容而不引用局面本身, 以免留住整条变例链。
+        对局状态不随载入判定, 需要时调用 check_game_status()。
+        """
+        scratch = self._scratch
+        game = getattr(scratch, 'game', None)
+        if game is None:
+            game = scratch.game = ChineseChess()
+            scratch.state = None
+        state = (self.key, self.squares, self.halfmove, self.fullmove)
+        if scratch.state != state:
+            game._load_position(self.squares, self.color, self.key, self.halfmove, self.fullmove)
+            scratch.state = state
+        return game
+
+    def apply(self, move):
+        """走一步 (不做合法性检查), 返回新局面"""
+        from_sq, to_sq = move >> 8, move & 255
+        squares = bytearray(self.squares)
+        piece = squares[from_sq]
+        captured = squares[to_sq]
+        squares[to_sq] = piece
+        squares[from_sq] = EMPTY
+        key = (self.key ^ ZOBRIST_PIECES[piece][from_sq] ^ ZOBRIST_PIECES[piece][to_sq]
+               ^ ZOBRIST_PIECES[captured][to_sq] ^ ZOBRIST_SIDE)
+        color = 'black' if self.color == 'red' else 'red'
+        return Position(squares, color, self, move, key,
+                        0 if captured else self.halfmove + 1,
+                        self.fullmove + (1 if color == 'red' else 0))
+
+    def legal_moves(self):
+        """轮走方的全部合法走法编码"""
+        return self._engine().legal_moves()
+
+    def is_legal(self, move):
+        """走法是否合法"""
+        from_row, from_col = divmod(move >> 8, 9)
+        to_row, to_col = divmod(move & 255, 9)
+        return self._engine().is_legal_move(from_row, from_col, to_row, to_col)
+
+    def in_check(self):
+        """轮走方是否被将军"""
+        return self._engine().is_in_check(self.color)
+
+    def status(self):
+        """不计循环局面时的对局结果: 'playing', 'red_wins' 或 'black_wins'"""
+        game = self._engine()
+        game.check_game_status()
+        return game.game_status
+
+    def moves(self):
+        """从变例树的根走到本局面的走法编码列表"""
+        moves = []
+        position = self
+        while position.parent is not None:
+            moves.append(position.move)
+            position = position.parent
+        moves.reverse()
+        return moves
+
+    def repetition_count(self):
+        """本局面在变例中出现的次数 (含自身), 只比较同一方走的局面"""
+        count = 1
+        position = self.parent
+        while position is not None and position.parent is not None:
+            position = position.parent
+            if position.key == self.key and position.squares == self.squares:
+                count += 1
+            position = position.parent
+        return count
+
+
+class CompactGame:
+    """省内存的对局状态: 只保存初始局面和走法, 用于服务器上同时保存大量对局
+
+    每局只有几个槽位属性、45 字节的初始局面和每步 2 字节的走法, 没有棋子对象。
+    走子和判定时用本线程的一局 ChineseChess 走到当前局面, 见 _engine()。
+    serialize() 的结果为 52 + 2 * 步数 字节。
+    """
+    __slots__ = ('start', 'start_player', 'start_halfmove', 'start_fullmove', 'moves', 'status')
+
+    SERIAL_VERSION = 1
+    _HEADER = struct.Struct('<BBBHH')  # 版本, 初始轮走方, 对局状态, 半回合计数, 回合数
+    _STATUS_CODES = ('playing', 'red_wins', 'black_wins', 'draw')
+    _scratch = threading.local()
+
+    def __init__(self, fen=START_FEN):
+        game = ChineseChess.from_fen(fen)
+        self.start = _pack_squares(game.squares)
+        self.start_player = game.current_player
+        self.start_halfmove = game.start_halfmove
+        self.start_fullmove = game.start_fullmove
+        self.moves = array('H')
+        self.status = game.game_status
+
+    @classmethod
+    def from_game(cls, game):
+        """由 ChineseChess 对局 (含悔棋历史) 生成"""
+        start = game.clone()
+        while start.history_len:
+            start.unmake_move()
+        compact = cls.__new__(cls)
+        compact.start = _pack_squares(start.squares)
+        compact.start_player = game.start_player
+        compact.start_halfmove = game.start_halfmove
+        compact.start_fullmove = game.start_fullmove
+        compact.moves = array('H', game.move_history)
+        compact.status = game.game_status
+        return compact
+
+    def to_game(self, game=None):
+        """重放到 game (默认新建一局) 上并返回它"""
+        if game is None:
+            game = ChineseChess()
+        game.load_squares(_unpack_squares(self.start), self.start_player,
+                          self.start_halfmove, self.start_fullmove)
+        for move in self.moves:
+            game.make_move(move)
+        game.check_game_status()
+        return game
+
+    def _engine(self):
+        """本线程的临时对局, 已走到当前局面
+
+        临时对局记着上次走到的是哪一局的哪一步: 同一局接着走或悔棋时只补走或退回相差的几步,
+        换成另一局时才从初始局面整局重放, 耗时与步数成正比。
+        """
+        scratch = self._scratch
+        game = getattr(scratch, 'game', None)
+        if game is None:
+            game = scratch.game = ChineseChess()
+            scratch.owner = None
+        moves = self.moves
+        length = len(moves)
+
+        if scratch.owner is self:
+            done = len(scratch.moves)
+            if done >= length and scratch.moves[:length] == moves:
+                if done > length:
+                    for _ in range(done - length):
+                        game.unmake_move()
+                    del scratch.moves[length:]
+                    game.check_game_status()
+                return game
+            if moves[:done] == scratch.moves:
+                for move in moves[done:]:
+                    game.make_move(move)
+                scratch.moves = array('H', moves)
+                game.check_game_status()
+                return game
+
+        # 重放出错时不能留下半途的缓存
+        scratch.owner = None
+        self.to_game(game)
+        # 只引用最近一局, 每个线程至多多留住一个对局对象
+        scratch.owner = self
+        scratch.moves = array('H', moves)
+        return game
+
+    @property
+    def current_player(self):
+        if len(self.moves) % 2:
+            return 'black' if self.start_player == 'red' else 'red'
+        return self.start_player
+
+    def move_piece(self, from_row, from_col, to_row, to_col):
+        """走一步, 不合法或对局已结束时返回 False"""
+        if self.status != 'playing':
+            return False
+        game = self._engine()
+        if not game.move_piece(from_row, from_col, to_row, to_col):
+            return False
+        move = encode_move(from_row * 9 + from_col, to_row * 9 + to_col)
+        self.moves.append(move)
+        self._scratch.moves.append(move)
+        self.status = game.game_status
+        return True
+
+    def undo_move(self):
+        """悔一步棋"""
+        if not self.moves:
+            return False
+        self.moves.pop()
+        self.status = 'playing'
+        return True
+
+    def to_fen(self):
+        """当前局面的 FEN"""
+        return self._engine().to_fen()
+
+    def serialize(self):
+        """序列化为 bytes"""
+        header = self._HEADER.pack(self.SERIAL_VERSION, COLOR_BITS[self.start_player],
+                                   self._STATUS_CODES.index(self.status),
+                                   self.start_halfmove, self.start_fullmove)
+        moves = array('H', self.moves)
+        if sys.byteorder == 'big':
+            moves.byteswap()
+        return header + self.start + moves.tobytes()
+
+    @classmethod
+    def deserialize(cls, data):
+        """由 serialize() 的结果还原"""
+        header_size = cls._HEADER.size
+        moves_offset = header_size + BOARD_SIZE // 2
+        if len(data) < moves_offset or (len(data) - moves_offset) % 2:
+            raise ValueError('对局数据长度无效')
+        version, side, status, halfmove, fullmove = cls._HEADER.unpack_from(data)
+        if version != cls.SERIAL_VERSION or side not in COLOR_NAMES or status >= len(cls._STATUS_CODES):
+            raise ValueError('对局数据无效')
+
+        compact = cls.__new__(cls)
+        compact.start = bytes(data[header_size:moves_offset])
+        compact.start_player = COLOR_NAMES[side]
+        compact.start_halfmove = halfmove
+        compact.start_fullmove = fullmove
+        compact.moves = array('H')
+        compact.moves.frombytes(data[moves_offset:])
+        if sys.byteorder == 'big':
+            compact.moves.byteswap()
+        if compact._validate() != cls._STATUS_CODES[status]:
+            raise ValueError('对局数据中的对局状态与走法不符')
+        compact.status = cls._STATUS_CODES[status]
+        return compact
+
+    def _validate(self):
+        """检查初始局面的棋子编码并逐步按规则重放一遍, 返回重放得到的对局状态
+
+        数据无效时抛出 ValueError。
+        """
+        squares = _unpack_squares(self.start)
+        if any(code and not code & TYPE_MASK for code in squares):
+            raise ValueError('对局数据中有无效的棋子编码')
+        game = ChineseChess()
+        game.load_squares(squares, self.start_player, self.start_halfmove, self.start_fullmove)
+        for move in self.moves:
+            from_row, from_col = divmod(move >> 8, 9)
+            to_row, to_col = divmod(move & 255, 9)
+            if not game.move_piece(from_row, from_col, to_row, to_col):
+                raise ValueError('对局数据中有非法走法: %04x' % move)
+        return game.game_status
+
+
+def _pack_squares(squares):
+    """90 格的棋子编码每两格压成一个字节"""
+    return bytes(squares[sq] | squares[sq + 1] << 4 for sq in range(0, BOARD_SIZE, 2))
+
+def _unpack_squares(packed):
+    """_pack_squares 的逆变换"""
+    squares = bytearray(BOARD_SIZE)
+    squares[0::2] = bytes(byte & 15 for byte in packed)
+    squares[1::2] = bytes(byte >> 4 for byte in packed)
+    return squares
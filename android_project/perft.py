@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+中国象棋走法生成器的 perft 校验与性能测试
+
+用法:
+    python perft.py                          运行参考局面套件 (默认深度3)、静态交换评估和循环判定校验
+    python perft.py --depth 4                套件跑到深度4
+    python perft.py --divide 3 --moves h2e2  按第一步分解指定局面的 perft
+    python perft.py --divide 3 --fen "..."   从 FEN 局面分解
+"""
+
+import os
+import sys
+import time
+import argparse
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chinese_chess import ChineseChess, START_FEN, iccs_to_move
+
+# 参考局面: (名称, FEN, 各深度的节点数)
+# 开局的数值为公开的象棋 perft 结果, 其余局面已用原始逐格扫描的走法生成
+# 加整盘搜索将军的方式独立核对
+PERFT_SUITE = [
+    ('开局', START_FEN, (44, 1920, 79666, 3290240)),
+    ('中炮对屏风马 炮打中兵',
+     'r1bakabr1/9/2n4c1/pC2n1pRp/2p6/9/c1P1P1P1P/2N3N2/9/R1BAKAB2 w - - 0 8',
+     (43, 1685, 71765, 2882230)),
+    ('炮换马 双炮镇中',
+     '1rbakabnr/9/7c1/p1p1C1p1p/9/9/P1P1c1P1P/9/9/RNBAKABNR w - - 0 4',
+     (23, 1008, 25099, 1100349)),
+    ('车砍士将军',
+     '2bakab1r/9/1cn3nc1/p1P1p1C1p/6p2/4P4/P5P1P/1CN6/8R/R1BrKABN1 w - - 0 9',
+     (3, 113, 4722, 180024)),
+    ('中局 马炮混战',
+     'r1ba1a3/4kn3/2n1b4/pNp1p1p1p/4c4/6P2/P1P2R2P/1CcC5/9/2BAKAB2 w - - 0 1',
+     (38, 1128, 43929)),
+    ('残局 车兵对士象', '3ak4/4a4/4b4/9/9/4P4/9/9/9/3K1R3 w - - 0 1', (16, 109, 1815, 10934)),
+    ('残局 马炮对马象', '4k4/9/4b4/9/2n6/6C2/9/4B4/4A4/3AK1N2 b - - 0 1', (14, 336, 4248, 97539)),
+    ('残局 双车对车', '2bak4/4a4/9/9/r8/9/9/9/4A4/2R1K1R2 w - - 0 1', (30, 644, 18937, 374270)),
+    ('残局 兵卒对将', '3k5/4P4/9/9/9/9/9/9/4p4/4K4 w - - 0 1', (2, 3, 9, 20)),
+]
+
+# 静态交换评估参考局面: (名称, FEN, ICCS 走法, 期望的 see 值)
+SEE_SUITE = [
+    ('车吃有根兵', '4k4/9/9/4p4/4p4/9/9/9/9/3KR4 w - - 0 1', 'e0e5', -80),
+    ('炮隔兵吃卒 车不敢吃回', '4k4/9/4r4/9/4p4/4P4/9/9/4C4/3K1R3 w - - 0 1', 'e1e5', 10),
+    ('车吃卒 黑车被炮挡住', '4k4/4r4/9/4c4/4p4/9/9/4R4/9/3KR4 w - - 0 1', 'e2e5', 10),
+    ('九宫 将吃车后被叠车吃', '4k4/4a4/9/9/4R4/9/4R4/9/9/3K5 w - - 0 1', 'e5e8', 20),
+    ('九宫 将吃车后照面', '3k5/3n5/9/9/9/9/9/9/3R5/3K5 w - - 0 1', 'd1d8', 40),
+]
+
+# 循环局面判定参考: (名称, FEN, 走到第三次重复的 ICCS 走法, 期望的对局状态)
+REPETITION_SUITE = [
+    ('车长将判负', '4k4/9/9/9/9/9/9/9/9/R2K5 w - - 0 1',
+     'a0a9 e9e8 a9a8 e8e9 a8a9 e9e8 a9a8 e8e9 a8a9', 'black_wins'),
+    ('马长捉车判负', '4k4/9/N8/9/4r4/9/9/9/9/3K5 w - - 0 1',
+     'a7c6 e5b5 c6a7 b5e5 a7c6 e5b5 c6a7 b5e5', 'black_wins'),
+    ('帅捉无根炮不算长捉', '5k3/9/9/9/9/9/9/5c3/3cK4/9 w - - 0 1',
+     'e1f1 f9f8 f1e1 f8f9 e1f1 f9f8 f1e1 f8f9', 'draw'),
+]
+
+
+def setup_position(fen=START_FEN, moves=''):
+    """载入 FEN 局面后依次走 ICCS 走法, 返回得到的局面"""
+    game = ChineseChess.from_fen(fen)
+    for text in moves.split():
+        move = iccs_to_move(text)
+        from_row, from_col = divmod(move >> 8, 9)
+        to_row, to_col = divmod(move & 255, 9)
+        if not game.move_piece(from_row, from_col, to_row, to_col):
+            raise ValueError('非法走法: %s' % text)
+    return game
+
+
+def run_suite(max_depth):
+    """运行参考局面套件, 返回不一致的数量"""
+    failures = 0
+    total_nodes = 0
+    total_time = 0.0
+
+    for name, fen, expected in PERFT_SUITE:
+        game = setup_position(fen)
+        for depth, expected_nodes in enumerate(expected[:max_depth], 1):
+            start = time.perf_counter()
+            nodes = game.perft(depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+
+            status = 'OK' if nodes == expected_nodes else '错误 (应为 %d)' % expected_nodes
+            if nodes != expected_nodes:
+                failures += 1
+            print('%-24s 深度 %d: %10d  %8.3fs  %s' % (name, depth, nodes, elapsed, status))
+
+    nps = total_nodes / total_time if total_time > 0 else 0
+    print('共 %d 个节点, %.2fs, %.0f 节点/秒' % (total_nodes, total_time, nps))
+    return failures
+
+
+def run_see_suite():
+    """校验静态交换评估的参考局面, 返回不一致的数量"""
+    failures = 0
+    for name, fen, text, expected in SEE_SUITE:
+        value = setup_position(fen).see(iccs_to_move(text))
+        status = 'OK' if value == expected else '错误 (应为 %d)' % expected
+        if value != expected:
+            failures += 1
+        print('%-24s see %s: %6d  %s' % (name, text, value, status))
+    return failures
+
+
+def run_repetition_suite():
+    """校验循环局面判定的参考对局, 返回不一致的数量"""
+    failures = 0
+    for name, fen, moves, expected in REPETITION_SUITE:
+        status = setup_position(fen, moves).game_status
+        result = 'OK' if status == expected else '错误 (应为 %s)' % expected
+        if status != expected:
+            failures += 1
+        print('%-24s %-10s  %s' % (name, status, result))
+    return failures
+
+
+def run_divide(depth, fen, moves):
+    """打印指定局面的 perft 分解"""
+    game = setup_position(fen, moves)
+    start = time.perf_counter()
+    result = game.perft_divide(depth)
+    elapsed = time.perf_counter() - start
+
+    for move in sorted(result):
+        print('%s: %d' % (move, result[move]))
+    total = sum(result.values())
+    nps = total / elapsed if elapsed > 0 else 0
+    print('走法数 %d, 节点数 %d, %.3fs, %.0f 节点/秒' % (len(result), total, elapsed, nps))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='中国象棋走法生成器 perft 测试')
+    parser.add_argument('--depth', type=int, default=3, help='套件的最大深度')
+    parser.add_argument('--divide', type=int, metavar='DEPTH', help='按第一步分解 perft')
+    parser.add_argument('--fen', default=START_FEN, help='起始局面, 默认为开局')
+    parser.add_argument('--moves', nargs='*', default=[], help='从起始局面走到目标局面的ICCS走法')
+    args = parser.parse_args(argv)
+
+    if args.divide:
+        run_divide(args.divide, args.fen, ' '.join(args.moves))
+        return 0
+    failures = run_suite(args.depth) + run_see_suite() + run_repetition_suite()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
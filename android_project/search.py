@@ -0,0 +1,603 @@
+#!/usr/bin/env python3
+"""
+中国象棋 AI 搜索
+
+迭代加深的 negamax alpha-beta 搜索, 评估为子力加位置分。
+search(position, limits) 返回最佳走法、分数和主要变例, limits 可限制深度、节点数和时间,
+用于在手机上把每步的计算量控制在可预期的范围内。
+"""
+
+import time
+from array import array
+
+from chinese_chess import (
+    Position, BOARD_SIZE, BOARD_COLS, SIDE_SLOTS, NO_SQUARE, TYPE_MASK, COLOR_BITS, COLOR_MASK,
+    GENERAL, ADVISOR, ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER, BLACK, move_to_iccs,
+)
+
+# 杀棋分: 轮走方无子可走时为 -MATE_SCORE + ply, 绝对值超过 MATE_BOUND 的都是杀棋
+MATE_SCORE = 30000
+MATE_BOUND = MATE_SCORE - 1000
+MAX_PLY = 64
+MAX_DEPTH = 32
+
+# 评估用的子力价值 (兵为 100), 将帅不计子力
+EVAL_VALUES = (0, 0, 200, 200, 400, 900, 450, 100)
+
+# 位置分: 以红方视角按 row * 9 + col 排列, 第0行为黑方底线; 黑方按上下翻转取值
+SOLDIER_PST = (
+    0, 0, 0, 0, 0, 0, 0, 0, 0,
+    20, 30, 50, 60, 70, 60, 50, 30, 20,
+    20, 30, 45, 55, 60, 55, 45, 30, 20,
+    20, 27, 30, 40, 42, 40, 30, 27, 20,
+    10, 18, 22, 35, 40, 35, 22, 18, 10,
+    3, 0, 8, 0, 8, 0, 8, 0, 3,
+    -2, 0, -2, 0, 6, 0, -2, 0, -2,
+    0, 0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0, 0,
+)
+
+HORSE_PST = (
+    4, 8, 16, 12, 4, 12, 16, 8, 4,
+    4, 10, 28, 16, 8, 16, 28, 10, 4,
+    12, 14, 16, 20, 18, 20, 16, 14, 12,
+    8, 24, 18, 24, 20, 24, 18, 24, 8,
+    6, 16, 14, 18, 16, 18, 14, 16, 6,
+    4, 12, 16, 14, 12, 14, 16, 12, 4,
+    2, 6, 8, 6, 10, 6, 8, 6, 2,
+    4, 2, 8, 8, 4, 8, 8, 2, 4,
+    0, 2, 4, 4, -2, 4, 4, 2, 0,
+    0, -4, 0, 0, 0, 0, 0, -4, 0,
+)
+
+CHARIOT_PST = (
+    14, 14, 12, 18, 16, 18, 12, 14, 14,
+    16, 20, 18, 24, 26, 24, 18, 20, 16,
+    12, 12, 12, 18, 18, 18, 12, 12, 12,
+    12, 18, 16, 22, 22, 22, 16, 18, 12,
+    12, 14, 12, 18, 18, 18, 12, 14, 12,
+    12, 16, 14, 20, 20, 20, 14, 16, 12,
+    6, 10, 8, 14, 14, 14, 8, 10, 6,
+    4, 8, 6, 14, 12, 14, 6, 8, 4,
+    8, 4, 8, 16, 8, 16, 8, 4, 8,
+    -2, 10, 6, 14, 12, 14, 6, 10, -2,
+)
+
+CANNON_PST = (
+    6, 4, 0, -10, -12, -10, 0, 4, 6,
+    2, 2, 0, -4, -14, -4, 0, 2, 2,
+    2, 2, 0, -10, -8, -10, 0, 2, 2,
+    0, 0, -2, 4, 10, 4, -2, 0, 0,
+    0, 0, 0, 2, 8, 2, 0, 0, 0,
+    -2, 0, 4, 2, 6, 2, 4, 0, -2,
+    0, 0, 0, 2, 4, 2, 0, 0, 0,
+    4, 0, 8, 6, 10, 6, 8, 0, 4,
+    0, 2, 4, 6, 6, 6, 4, 2, 0,
+    0, 0, 2, 6, 6, 6, 2, 0, 0,
+)
+
+
+def _palace_pst(bonuses):
+    """只在少数格子上有加减分的位置表, bonuses 为 {(row, col): 分数}"""
+    return tuple(bonuses.get(divmod(sq, BOARD_COLS), 0) for sq in range(BOARD_SIZE))
+
+GENERAL_PST = _palace_pst({(9, 4): 4, (8, 4): -2, (7, 4): -8})
+ADVISOR_PST = _palace_pst({(8, 4): 4})
+ELEPHANT_PST = _palace_pst({(7, 4): 4, (7, 0): -2, (7, 8): -2})
+
+PIECE_PST = {GENERAL: GENERAL_PST, ADVISOR: ADVISOR_PST, ELEPHANT: ELEPHANT_PST,
+             HORSE: HORSE_PST, CHARIOT: CHARIOT_PST, CANNON: CANNON_PST, SOLDIER: SOLDIER_PST}
+
+
+def _build_piece_scores():
+    """PIECE_SCORES[code][sq] = 子力 + 位置分, 红黑双方都为正"""
+    scores = [(0,) * BOARD_SIZE] * 16
+    for piece_type, pst in PIECE_PST.items():
+        value = EVAL_VALUES[piece_type]
+        scores[piece_type] = tuple(value + pst[sq] for sq in range(BOARD_SIZE))
+        scores[BLACK | piece_type] = tuple(
+            value + pst[(9 - sq // BOARD_COLS) * BOARD_COLS + sq % BOARD_COLS] for sq in range(BOARD_SIZE))
+    return tuple(scores)
+
+PIECE_SCORES = _build_piece_scores()
+
+
+# 静态搜索的 delta 剪枝余量: 吃子后仍比 alpha 差这么多就不必再算
+DELTA_MARGIN = 200
+
+# 选择性搜索的参数
+NULL_MOVE_MIN_DEPTH = 3  # 剩余深度不少于这个值才试空着
+NULL_MOVE_ENDGAME_PIECES = 2  # 己方车马炮少于这个数时, 空着剪枝要做验证搜索
+LMR_MIN_DEPTH = 3  # 剩余深度不少于这个值才减少后面走法的深度
+LMR_MIN_MOVES = 3  # 前几步走法不减
+FUTILITY_MARGIN = 200  # 距叶子一层时, 静态评估加这个余量仍不到 alpha 的不吃子走法不搜
+RAZOR_MARGINS = (0, 300, 500)  # 按剩余深度, 静态评估加余量仍不到 alpha 时直接转静态搜索
+
+# 历史分超过这个值时全部减半, 防止溢出并让新的信息占更大比重
+HISTORY_LIMIT = 1 << 24
+
+# 置换表的分数类型
+EXACT, LOWER_BOUND, UPPER_BOUND = 1, 2, 3
+
+DEFAULT_TABLE_MB = 4
+
+
+class TranspositionTable:
+    """按 Zobrist 键索引的置换表, 大小在创建时固定, 不会随搜索增长
+
+    每个桶两格: 第0格按深度优先替换 (旧一代的条目总是可以替换), 第1格总是替换。
+    每格为 keys 和 data 两个 array('Q') 中的各一项, 共16字节, data 的位布局为:
+    走法 16 位 | 分数 + 32768 16 位 | 深度 8 位 | 分数类型 2 位 | 代数 8 位。
+    data 为0表示空格。
+    """
+
+    ENTRY_BYTES = 16
+
+    def __init__(self, size_mb=DEFAULT_TABLE_MB):
+        entries = max(int(size_mb * (1 << 20)) // self.ENTRY_BYTES, 2)
+        buckets = 1
+        while buckets * 4 <= entries:
+            buckets *= 2
+        self.mask = buckets - 1
+        self.keys = array('Q', bytes(8 * 2 * buckets))
+        self.data = array('Q', bytes(8 * 2 * buckets))
+        self.generation = 0
+
+    def clear(self):
+        """清空全部条目"""
+        size = len(self.keys)
+        self.keys = array('Q', bytes(8 * size))
+        self.data = array('Q', bytes(8 * size))
+        self.generation = 0
+
+    def new_search(self):
+        """开始新一次搜索: 代数加一, 之前留下的条目变为可替换"""
+        self.generation = (self.generation + 1) & 255
+
+    def probe(self, key):
+        """查找 key, 返回 (走法, 分数, 深度, 分数类型), 没有时返回 None"""
+        index = (key & self.mask) << 1
+        keys = self.keys
+        for slot in (index, index + 1):
+            if keys[slot] == key:
+                data = self.data[slot]
+                if data:
+                    return (data & 0xFFFF, (data >> 16 & 0xFFFF) - 32768,
+                            data >> 32 & 255, data >> 40 & 3)
+        return None
+
+    def store(self, key, move, score, depth, flag):
+        """保存一个条目, 分数应已换算为相对本节点的杀棋分"""
+        index = (key & self.mask) << 1
+        keys, data = self.keys, self.data
+        old = data[index]
+        if (not old or keys[index] == key or depth >= (old >> 32 & 255)
+                or (old >> 42) != self.generation):
+            slot = index
+        else:
+            slot = index + 1
+        if not move and keys[slot] == key:
+            move = data[slot] & 0xFFFF  # 没有新的最佳走法时保留原来的
+        keys[slot] = key
+        data[slot] = (move | (score + 32768) << 16 | min(depth, 255) << 32
+                      | flag << 40 | self.generation << 42)
+
+    def hashfull(self):
+        """抽样估计本代条目的占用率 (千分比)"""
+        data = self.data
+        sample = min(len(data), 2000)
+        used = sum(1 for slot in range(sample) if data[slot] and data[slot] >> 42 == self.generation)
+        return used * 1000 // sample
+
+
+def _score_to_table(score, ply):
+    """杀棋分换算为相对当前节点的步数再存表"""
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def _score_from_table(score, ply):
+    """_score_to_table 的逆变换"""
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+class SearchLimits:
+    """搜索限制: 最大深度、节点数和秒数, 为 None 的不限制 (全为 None 时按深度4)"""
+
+    def __init__(self, depth=None, nodes=None, time=None):
+        if depth is None and nodes is None and time is None:
+            depth = 4
+        self.depth = min(depth or MAX_DEPTH, MAX_DEPTH)
+        self.nodes = nodes
+        self.time = time
+
+
+class SearchOptions:
+    """选择性搜索的开关, 便于分别比较各项剪枝省下的节点数"""
+
+    def __init__(self, null_move=True, late_move_reductions=True, futility=True, razoring=True):
+        self.null_move = null_move
+        self.late_move_reductions = late_move_reductions
+        self.futility = futility
+        self.razoring = razoring
+
+
+class SearchResult:
+    """搜索结果: 分数为轮走方视角, pv 为走法编码列表, stats 为各项计数"""
+
+    def __init__(self, best_move, score, pv, depth, nodes, elapsed, stats=None):
+        self.best_move = best_move
+        self.score = score
+        self.pv = pv
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.stats = stats or {}
+
+    def __repr__(self):
+        return 'SearchResult(%s, score=%d, depth=%d, nodes=%d, pv=%s)' % (
+            move_to_iccs(self.best_move) if self.best_move else None, self.score,
+            self.depth, self.nodes, ' '.join(move_to_iccs(move) for move in self.pv))
+
+
+class SearchAborted(Exception):
+    """节点数或时间用完, 放弃当前这一轮迭代"""
+
+
+class Searcher:
+    """在一局 ChineseChess 的副本上做搜索, 不改动调用方的对局"""
+
+    def __init__(self, game, limits, table=None, options=None):
+        self.game = game
+        self.limits = limits
+        self.options = options or SearchOptions()
+        self.table = table if table is not None else TranspositionTable()
+        self.table_hits = 0
+        self.quiescence_nodes = 0
+        self.beta_cutoffs = 0
+        self.first_move_cutoffs = 0  # 第一步就剪枝的次数, 衡量走法排序的好坏
+        self.null_move_tries = 0
+        self.null_move_cutoffs = 0
+        self.null_move_verifications = 0
+        self.reductions = 0
+        self.reduction_researches = 0
+        self.futility_prunes = 0
+        self.razor_prunes = 0
+        # 走法排序表, 都在创建时一次分配好:
+        # killers[ply * 2 + i] 为该层的两个杀手走法; history[from * 90 + to] 为历史分;
+        # countermoves[上一步 from * 90 + to] 为对上一步曾经导致剪枝的应着
+        self.killers = array('H', bytes(2 * 2 * MAX_PLY))
+        self.history = array('i', bytes(4 * BOARD_SIZE * BOARD_SIZE))
+        self.countermoves = array('H', bytes(2 * BOARD_SIZE * BOARD_SIZE))
+        self.root_length = game.history_len
+        self.nodes = 0
+        self.node_limit = limits.nodes
+        self.deadline = None
+        self.can_abort = False
+        # 三角形主要变例表: pv[ply] 为从 ply 开始的变例
+        self.pv = [[0] * MAX_PLY for _ in range(MAX_PLY)]
+        self.pv_length = [0] * MAX_PLY
+        self.previous_pv = []
+
+    def stats(self):
+        """各项计数, 用于比较走法排序和剪枝的效果"""
+        return {name: getattr(self, name) for name in (
+            'nodes', 'quiescence_nodes', 'table_hits', 'beta_cutoffs', 'first_move_cutoffs',
+            'null_move_tries', 'null_move_cutoffs', 'null_move_verifications', 'reductions',
+            'reduction_researches', 'futility_prunes', 'razor_prunes')}
+
+    def _attacking_pieces(self, side):
+        """side 方车马炮的数量, 判断空着剪枝是否可能遇到等着 (zugzwang)"""
+        game = self.game
+        squares = game.squares
+        base = (side >> 3) * SIDE_SLOTS
+        count = 0
+        for sq in game.piece_squares[base:base + SIDE_SLOTS]:
+            if sq != NO_SQUARE and (squares[sq] & TYPE_MASK) in (HORSE, CHARIOT, CANNON):
+                count += 1
+        return count
+
+    def evaluate(self):
+        """轮走方视角的静态评估"""
+        game = self.game
+        squares = game.squares
+        piece_squares = game.piece_squares
+        score = 0
+        for sq in piece_squares[:SIDE_SLOTS]:
+            if sq != NO_SQUARE:
+                score += PIECE_SCORES[squares[sq]][sq]
+        for sq in piece_squares[SIDE_SLOTS:]:
+            if sq != NO_SQUARE:
+                score -= PIECE_SCORES[squares[sq]][sq]
+        return score if game.current_player == 'red' else -score
+
+    def _check_limits(self):
+        """超出节点数或时间时中止本轮迭代 (第一轮总是走完, 保证有走法可用)"""
+        if not self.can_abort:
+            return
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchAborted()
+        if self.deadline is not None and not self.nodes & 1023 and time.perf_counter() >= self.deadline:
+            raise SearchAborted()
+
+    def alpha_beta(self, depth, alpha, beta, ply, allow_null=True):
+        """negamax alpha-beta, 返回轮走方视角的分数"""
+        game = self.game
+        self.nodes += 1
+        self._check_limits()
+        self.pv_length[ply] = ply
+
+        # 循环局面按长将/长捉规则计分: 犯规一方按被将死计, 否则为和
+        if ply:
+            result = game.repetition_result()
+            if result == 'draw':
+                return 0
+            if result is not None:
+                if result == ('red_wins' if game.current_player == 'red' else 'black_wins'):
+                    return MATE_SCORE - ply
+                return -MATE_SCORE + ply
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self.quiesce(alpha, beta, ply)
+
+        # 置换表: 深度足够时直接用存下的分数 (根节点除外, 保证有完整的变例)
+        key = game.zobrist_key
+        entry = self.table.probe(key)
+        hash_move = 0
+        if entry is not None:
+            hash_move, score, entry_depth, flag = entry
+            if ply and entry_depth >= depth:
+                score = _score_from_table(score, ply)
+                if (flag == EXACT or (flag == LOWER_BOUND and score >= beta)
+                        or (flag == UPPER_BOUND and score <= alpha)):
+                    self.table_hits += 1
+                    return score
+        if not hash_move and ply < len(self.previous_pv):
+            hash_move = self.previous_pv[ply]
+
+        options = self.options
+        side = COLOR_BITS[game.current_player]
+        in_check = game._in_check(side)
+        static_eval = None
+        if ply and not in_check and abs(beta) < MATE_BOUND:
+            static_eval = self.evaluate()
+
+            # 剃刀: 离叶子很近且评估远低于 alpha, 直接看静态搜索能否追回
+            if options.razoring and depth < len(RAZOR_MARGINS) and not hash_move:
+                if static_eval + RAZOR_MARGINS[depth] <= alpha:
+                    score = self.quiesce(alpha, beta, ply)
+                    if score <= alpha:
+                        self.razor_prunes += 1
+                        return score
+
+            # 空着: 让对方连走两步仍然不低于 beta, 说明本局面足够好, 可以剪掉
+            if (options.null_move and allow_null and depth >= NULL_MOVE_MIN_DEPTH
+                    and static_eval >= beta):
+                attackers = self._attacking_pieces(side)
+                if attackers:
+                    self.null_move_tries += 1
+                    reduction = 3 if depth > 6 else 2
+                    game.make_null_move()
+                    score = -self.alpha_beta(depth - 1 - reduction, -beta, -beta + 1, ply + 1, False)
+                    game.unmake_null_move()
+                    if score >= beta:
+                        # 残局子少时可能是等着, 用不走空着的浅层搜索验证
+                        if attackers < NULL_MOVE_ENDGAME_PIECES:
+                            self.null_move_verifications += 1
+                            score = self.alpha_beta(depth - reduction, beta - 1, beta, ply, False)
+                        if score >= beta:
+                            self.null_move_cutoffs += 1
+                            return beta if score >= MATE_BOUND else score
+
+        # 对上一步的应着和本层的两个杀手走法排在吃子之后、其余不吃子走法之前
+        killers = self.killers
+        previous = game.history[game.history_len - 1] & 0xFFFF if game.history_len else 0
+        counter_index = (previous >> 8) * BOARD_SIZE + (previous & 255)
+        good_quiets = (killers[ply * 2], killers[ply * 2 + 1],
+                       self.countermoves[counter_index] if previous else 0)
+
+        # 距叶子一层且评估加余量仍不到 alpha 时, 不吃子、不将军的走法不搜
+        futile = (options.futility and depth == 1 and static_eval is not None
+                  and static_eval + FUTILITY_MARGIN <= alpha)
+        reduce_late = options.late_move_reductions and depth >= LMR_MIN_DEPTH and not in_check
+
+        original_alpha = alpha
+        best = -MATE_SCORE + ply  # 无子可走 (将死或困毙) 即为负
+        best_move = 0
+        searched = 0
+        for move in game.iter_moves(hash_move, good_quiets, self.history):
+            quiet = not game.squares[move & 255]
+            game.make_move(move)
+            gives_check = (futile or reduce_late) and game._in_check(side ^ COLOR_MASK)
+            if futile and quiet and searched and not gives_check and move != hash_move:
+                game.unmake_move()
+                self.futility_prunes += 1
+                if best < static_eval + FUTILITY_MARGIN:
+                    best = static_eval + FUTILITY_MARGIN
+                continue
+
+            # 后面的不吃子走法先减一层 (走法很靠后且深度大时减两层) 用零窗口试搜, 超过 alpha 再全深度重搜
+            if (reduce_late and quiet and searched >= LMR_MIN_MOVES and not gives_check
+                    and move not in good_quiets):
+                self.reductions += 1
+                reduction = 2 if searched >= 6 and depth >= 6 else 1
+                score = -self.alpha_beta(depth - 1 - reduction, -alpha - 1, -alpha, ply + 1)
+                if score > alpha:
+                    self.reduction_researches += 1
+                    score = -self.alpha_beta(depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = -self.alpha_beta(depth - 1, -beta, -alpha, ply + 1)
+            game.unmake_move()
+            searched += 1
+            if score > best:
+                best = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    self._update_pv(ply, move)
+                    if score >= beta:
+                        self.beta_cutoffs += 1
+                        if searched == 1:
+                            self.first_move_cutoffs += 1
+                        if quiet:
+                            self._update_quiet_tables(move, depth, ply, counter_index if previous else -1)
+                        break
+
+        if best >= beta:
+            flag = LOWER_BOUND
+        elif best > original_alpha:
+            flag = EXACT
+        else:
+            flag = UPPER_BOUND
+            best_move = 0
+        self.table.store(key, best_move, _score_to_table(best, ply), depth, flag)
+        return best
+
+    def quiesce(self, alpha, beta, ply):
+        """静态搜索: 只搜吃子直到局面平静, 被将军时搜全部应将"""
+        game = self.game
+        self.nodes += 1
+        self.quiescence_nodes += 1
+        self._check_limits()
+        self.pv_length[ply] = ply
+        if ply >= MAX_PLY - 1:
+            return self.evaluate()
+
+        if game._in_check(COLOR_BITS[game.current_player]):
+            best = -MATE_SCORE + ply
+            for move in game.iter_moves():
+                game.make_move(move)
+                score = -self.quiesce(-beta, -alpha, ply + 1)
+                game.unmake_move()
+                if score > best:
+                    best = score
+                    if score > alpha:
+                        alpha = score
+                        if score >= beta:
+                            break
+            return best
+
+        # 不吃子也可以 (站着不动的分数)
+        best = self.evaluate()
+        if best >= beta:
+            return best
+        if best > alpha:
+            alpha = best
+
+        squares = game.squares
+        for move in game.iter_captures():
+            # delta 剪枝: 吃子按被吃子价值从高到低排列, 这一步不够后面的也不够
+            if best + EVAL_VALUES[squares[move & 255] & TYPE_MASK] + DELTA_MARGIN <= alpha:
+                break
+            # SEE 剪枝: 交换下来亏子的吃子不搜
+            if game.see(move) < 0:
+                continue
+            game.make_move(move)
+            score = -self.quiesce(-beta, -alpha, ply + 1)
+            game.unmake_move()
+            if score > best:
+                best = score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        break
+        return best
+
+    def _update_quiet_tables(self, move, depth, ply, counter_index):
+        """不吃子的走法导致剪枝: 记为杀手走法和对上一步的应着, 并加历史分"""
+        killers = self.killers
+        if killers[ply * 2] != move:
+            killers[ply * 2 + 1] = killers[ply * 2]
+            killers[ply * 2] = move
+        if counter_index >= 0:
+            self.countermoves[counter_index] = move
+        history = self.history
+        index = (move >> 8) * BOARD_SIZE + (move & 255)
+        history[index] += depth * depth
+        if history[index] > HISTORY_LIMIT:
+            for index in range(len(history)):
+                history[index] >>= 1
+
+    def _update_pv(self, ply, move):
+        """把 move 接上下一层的变例作为本层的变例"""
+        pv = self.pv
+        row, child = pv[ply], pv[ply + 1]
+        row[ply] = move
+        length = self.pv_length[ply + 1]
+        row[ply + 1:length] = child[ply + 1:length]
+        self.pv_length[ply] = max(length, ply + 1)
+
+    def _extend_pv(self, pv, depth):
+        """置换表截断的变例沿表中的走法补到 depth 步"""
+        game = self.game
+        table = self.table
+        for move in pv:
+            game.make_move(move)
+        pv = list(pv)
+        while len(pv) < depth:
+            entry = table.probe(game.zobrist_key)
+            if entry is None or not entry[0] or game.is_repetition():
+                break
+            move = entry[0]
+            from_row, from_col = divmod(move >> 8, 9)
+            to_row, to_col = divmod(move & 255, 9)
+            if not game.is_legal_move(from_row, from_col, to_row, to_col):
+                break
+            game.make_move(move)
+            pv.append(move)
+        while game.history_len > self.root_length:
+            game.unmake_move()
+        return pv
+
+    def run(self):
+        """迭代加深, 返回最后一轮完整搜索的结果"""
+        limits = self.limits
+        start = time.perf_counter()
+        if limits.time is not None:
+            self.deadline = start + limits.time
+
+        self.table.new_search()
+        result = SearchResult(0, 0, [], 0, 0, 0.0)
+        for depth in range(1, limits.depth + 1):
+            try:
+                score = self.alpha_beta(depth, -MATE_SCORE, MATE_SCORE, 0)
+            except SearchAborted:
+                # 中止时对局可能停在搜索中途, 撤销到根局面 (走法编码0为空着)
+                game = self.game
+                while game.history_len > self.root_length:
+                    if game.history[game.history_len - 1] & 0xFFFF:
+                        game.unmake_move()
+                    else:
+                        game.unmake_null_move()
+                break
+            pv = self._extend_pv(self.pv[0][:self.pv_length[0]], depth)
+            self.previous_pv = pv
+            result = SearchResult(pv[0] if pv else 0, score, pv, depth, self.nodes,
+                                  time.perf_counter() - start, self.stats())
+            self.can_abort = True
+            if abs(score) > MATE_BOUND:
+                break
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - start
+        result.stats = self.stats()
+        return result
+
+
+def search(position, limits=None, table=None, options=None):
+    """搜索 position (ChineseChess 或 Position) 的最佳走法, 返回 SearchResult
+
+    table 为跨多次搜索保留的 TranspositionTable, 不传时每次新建一个默认大小的表;
+    options 为 SearchOptions, 不传时打开全部选择性剪枝。
+    """
+    if isinstance(position, Position):
+        game = position.to_game()
+    else:
+        game = position.clone()
+    return Searcher(game, limits or SearchLimits(), table, options).run()